@@ -1,19 +1,30 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import mplfinance as mpf
 from tradingstrategy import TradingStrategy
-import yfinance as yf
+import tradingpattern as tp
+from pricecache import PriceCache
+from ledger import TransactionLedger
+from instrumentation import RunStats
+from resultwriter import ResultWriter
+from resultstore import ResultStore
+from compactprice import CompactPrice
+from datasource import PriceSource, YahooSource, bulk_fetch
 from datetime import date
 from datetime import datetime
 from dateutil import parser
-import xlsxwriter
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import inspect
+import itertools
+import io
 import os
 import re
 
 
 class BackTesting:
-    def __init__(self, strategy: TradingStrategy):
+    PERFORMANCE_COLUMNS = ["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL","Performance Metrics","Value"]
+
+    def __init__(self, strategy: TradingStrategy, cache_dir = None, result_store = None, source: PriceSource = None):
         # validation
         try:
             strategy_name = strategy.__name__()
@@ -25,16 +36,46 @@ class BackTesting:
 
         # initiation
         self.__strategy = strategy
-        self.__transaction = pd.DataFrame()
+        self.__ledger = TransactionLedger()
+        self.__buyandhold = {}
+        # performance metrics are computed once per run when it finishes
+        self.__run_metrics = {}
+        # strategy class and parameters of every run
+        self.__run_params = {}
+        self.__performance = None
         self.historical = {}
-        self.buyandhold = pd.DataFrame()
+        # persistent price cache shared across strategies, date ranges and processes
+        self.price_cache = PriceCache(cache_dir) if cache_dir else None
+        # source of price not in historical or price cache, pooling connections across tickers
+        self.source = source if source is not None else YahooSource()
+        # persistent store of run results, reused while neither the strategy nor the price changed
+        self.result_store = ResultStore(result_store) if result_store else None
+        self.__stats = None
+        self.__unique = None
+        self.__writer = None
+        self.__compact = False
+        self.__compact_dir = None
+        # finest timeframe of the timeframes being backtested, while a coarser one is backtested on bars resampled from it
+        self.__resampled_from = None
+        # indicators of the last run, reused by plot
+        self.__indicators = (None, None)
 
     @property
     def transaction(self):
-        if len(self.__transaction) < 1:
+        if len(self.__ledger) < 1:
             raise Exception("There is no transaction yet. Run backtesting first")
         else:
-            return self.__transaction.drop("UNIQUE", axis=1)
+            return self.__ledger.to_frame().drop("UNIQUE", axis=1)
+
+    @property
+    def buyandhold(self):
+        return pd.DataFrame(list(self.__buyandhold.values()), columns=["Buy and Hold Max Loss (%)","Buy and Hold P/L (%)","UNIQUE"])
+
+    @property
+    def run_stats(self):
+        if self.__stats is None:
+            raise Exception("Instrumentation is not enabled. Call instrument() before backtesting")
+        return self.__stats.to_frame()
 
     @property
     def strategy(self):
@@ -53,52 +94,222 @@ class BackTesting:
 
         self.__strategy = tradingStrategy
 
-    def backtesting(self, ticker :str, start_date: str, end_date: str, timeframe = "1d", buy_and_hold = False, verbose = True):
-        # validation
-        if timeframe not in ["1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h", "1d", "5d", "1wk", "1mo", "3mo"]:
-            raise ValueError("Only timeframe allowed are 1m,2m,5m,15m,30m,60m,90m,1h,1d,5d,1wk,1mo,3mo")
-        # validate date
-        try:
-            start_date = parser.parse(start_date)
-            end_date = parser.parse(end_date)
-        except:
-            raise ValueError("Start or End date is not a valid date format")
+    def instrument(self, enabled = True, memory = True, hook = None):
+        '''
+        Record wall time, bars, trades and peak memory of every stage of backtesting runs into run_stats
+        hook(record) is called with each stage record as it finishes
+        memory tracing slows down the run, set memory to False to record time only
+        '''
+        self.__stats = RunStats(memory = memory, hook = hook) if enabled else None
+
+    def stream_result(self, filepath, format = "parquet"):
+        '''
+        Write transaction, closed position and performance metrics of every run to filepath as soon as the run finishes
+        format is either parquet (one file per run under filepath/<table>/) or csv (appended to filepath/<table>.csv)
+        Set filepath to None to stop streaming
+        '''
+        self.__writer = ResultWriter(filepath, format) if filepath else None
+
+    def compact_price(self, enabled = True, directory = None):
+        '''
+        Keep price loaded from now on in historical as CompactPrice, with float32 OHLCV instead of float64
+        directory memory-maps the price of every ticker and timeframe from a sub directory of it
+        Backtesting results may differ from float64 price in the last digits of prices
+        '''
+        self.__compact = enabled
+        self.__compact_dir = directory
+
+    def __keep_price(self, ticker, timeframe, df):
+        # save price to historical, compacted if enabled, and return it as dataframe
+        df = self.__wall_time(df)
+        if self.__compact:
+            directory = os.path.join(self.__compact_dir, f"{ticker}_{timeframe}") if self.__compact_dir else None
+            price = CompactPrice.from_frame(df, directory)
+            self.historical[ticker + "|" + timeframe] = price
+            return price.to_frame()
+        self.historical[ticker + "|" + timeframe] = df
+        return df
 
+    @staticmethod
+    def __wall_time(df):
+        # intraday dates in the wall time of the exchange, as transactions are recorded, so that they compare with naive dates
+        if getattr(df["Date"].dtype, "tz", None) is None:
+            return df
+        df = df.copy()
+        df["Date"] = df["Date"].dt.tz_localize(None)
+        return df
+
+    def __stage(self, name, per_run = True):
+        # no-op unless instrumentation is enabled
+        if self.__stats is None:
+            return contextlib.nullcontext({})
+        return self.__stats.stage(self.__unique if per_run else None, name)
+
+    def backtesting(self, ticker :str, start_date: str, end_date: str, timeframe = "1d", buy_and_hold = False, verbose = True, timeframes = None):
+        '''
+        timeframes is an optional list of timeframes to backtest instead of timeframe,
+        price is downloaded once at the finest of them and resampled into the others.
+        Runs on resampled bars have an INTERVAL such as "1d from 1m" and do not share price or results with runs of timeframe
+        '''
         # get ticker
         if ticker.endswith(".txt"):
-            # read from text file
-            with open(ticker,"r") as f:
-                ticker = f.read()
+            # backtest every ticker listed in text file, fetching their price concurrently first
+            tickers = self.read_tickers(ticker)
+            # tickers whose price could not be fetched are skipped rather than fetched again
+            failed = self.prefetch(tickers, min(timeframes, key=self.bar_seconds) if timeframes else timeframe)
+            tickers = [t for t in tickers if t not in failed]
+            if len(tickers) < 1:
+                raise Exception(f"No historical data found for any of the tickers in {ticker}")
+            results = [self.backtesting(t, start_date, end_date, timeframe, buy_and_hold, verbose, timeframes) for t in tickers]
+            return pd.concat(results, ignore_index=True)
         else:
             ticker = ticker.upper()
 
+        if timeframes is not None:
+            for t in timeframes:
+                self.__validate(t, start_date, end_date)
+            timeframes = self.__load_timeframes(ticker, timeframes)
+            results = []
+            for t in timeframes:
+                self.__resampled_from = timeframes[0] if t != timeframes[0] else None
+                try:
+                    results.append(self.backtesting(ticker, start_date, end_date, t, buy_and_hold, verbose))
+                finally:
+                    self.__resampled_from = None
+            return pd.concat(results, ignore_index=True)
+
+        start_date, end_date = self.__validate(timeframe, start_date, end_date)
+        interval = timeframe if self.__resampled_from is None else self.__resampled(timeframe, self.__resampled_from)
+
         # get unique identifier of current backtesting
-        self.__unique = self.strategy.__repr__() + "|" + ticker + "|" + str(start_date) + " to " + str(end_date) + "|" + timeframe
+        self.__start_run(ticker, start_date, end_date, interval)
 
         # download historical price
-        if self.historical.get(self.__unique):
-            df = self.historical[self.__unique]
-        else:
-            df = self.download_price(ticker ,timeframe)
-            # save latest downloaded price
-            if "Adj Close" in df.columns:
-                df["Close"] = df["Adj Close"]
-                df = df.drop("Adj Close", axis=1)
-            self.historical[self.__unique] = df
-
-        df = df.sort_values("Date").dropna()
+        with self.__stage("download") as stage:
+            df = self.load_price(ticker, interval)
+            df = df.sort_values("Date").dropna()
+            stage["Bars"] = len(df)
+
+        # reuse stored result, signals only depend on price up to end_date
+        store_key = None
+        if self.result_store is not None:
+            with self.__stage("store") as stage:
+                store_key = self.result_store.key(self.strategy, ticker, start_date, end_date, interval, df[df["Date"] <= end_date])
+                stored = self.result_store.get(store_key)
+                if stored is not None:
+                    buy_date, buy_price, sell_date, sell_price, forced, bnh, min_close = stored
+                    self.__print_trades(ticker, buy_date, buy_price, sell_date, sell_price, forced, verbose)
+                    self.__record_trades(buy_date, buy_price, sell_date, sell_price)
+                    stage["Trades"] = len(buy_date)
+            if stored is not None:
+                return self.__finish_run(ticker, bnh, min_close, buy_and_hold)
 
         # get signal based on trading strategy and append to transaction
-        self.__get_trading_signal(ticker, df, start_date, end_date, verbose)
+        trades = self.__get_trading_signal(ticker, df, start_date, end_date, verbose)
         # generate buy and hold return
-        df_filtered = df[(df["Date"] >= start_date) & (df["Date"] <= end_date)].copy()
-        bnh = self.buy_and_hold(df_filtered)
-        max_paper_loss = ((bnh[0] - df_filtered["Close"].min()) / bnh[0]) if df_filtered["Close"].min() < bnh[0] else 0
-        bnh_series = pd.Series({"UNIQUE":self.__unique,
-                        "Buy and Hold P/L (%)": bnh[2],
-                        "Buy and Hold Max Loss (%)":-max_paper_loss})
-        # append buy and hold
-        self.__append_buyandhold(bnh_series)
+        with self.__stage("result") as stage:
+            df_filtered = df[(df["Date"] >= start_date) & (df["Date"] <= end_date)].copy()
+            bnh = self.buy_and_hold(df_filtered)
+            min_close = df_filtered["Close"].min()
+            stage["Bars"] = len(df_filtered)
+            if store_key is not None:
+                self.result_store.put(store_key, *trades, bnh, min_close)
+            return self.__finish_run(ticker, bnh, min_close, buy_and_hold)
+
+    def replay(self, bars, ticker: str, start_date: str, end_date: str, timeframe = "1d", buy_and_hold = False, verbose = True):
+        '''
+        Backtest by feeding bars one at a time to strategy.on_bar, the way a live strategy receives them
+        bars is an iterable of mappings with Date, Open, High, Low and Close sorted by Date,
+        e.g. BackTesting.iter_bars(filepath)
+        Bars before start_date only warm up the strategy and bars after end_date are not read.
+        Transactions and result are recorded as in backtesting
+        '''
+        ticker = ticker.upper()
+        start_date, end_date = self.__validate(timeframe, start_date, end_date)
+        self.__start_run(ticker, start_date, end_date, timeframe)
+
+        with self.__stage("replay") as stage:
+            self.strategy.reset()
+            if verbose:
+                print()
+                print(f"----- {ticker} Transaction(s) -----")
+            position = None
+            buy_date, buy_price, sell_date, sell_price = [], [], [], []
+            first_close, last_bar, min_close = None, None, None
+            num_bar = 0
+            for bar in bars:
+                date = pd.Timestamp(bar["Date"])
+                if date.tzinfo is not None:
+                    # intraday bars in the wall time of the exchange, as price in historical
+                    date = date.tz_localize(None)
+                if date > end_date:
+                    break
+                buy_signal, sell_signal = self.strategy.on_bar(bar)
+                if date < start_date:
+                    continue
+
+                close = bar["Close"]
+                if first_close is None:
+                    first_close, min_close = close, close
+                min_close = min(min_close, close)
+                last_bar = (date, close)
+                num_bar += 1
+                if position is None:
+                    if pd.notnull(buy_signal):
+                        position = (date, buy_signal)
+                        if verbose:
+                            print(f"Bought {ticker} at ${round(buy_signal,2)} on {str(date)[:10]}")
+                elif pd.notnull(sell_signal):
+                    buy_date.append(position[0])
+                    buy_price.append(position[1])
+                    sell_date.append(date)
+                    sell_price.append(sell_signal)
+                    position = None
+                    if verbose:
+                        print(f"Sold {ticker} at ${round(sell_signal,2)} on {str(date)[:10]}")
+
+            if last_bar is None:
+                raise Exception(f"No historical data found for {ticker}")
+            if position is not None:
+                # position still open at the end of the period is closed at the last price
+                buy_date.append(position[0])
+                buy_price.append(position[1])
+                sell_date.append(last_bar[0])
+                sell_price.append(last_bar[1])
+            self.__record_trades(buy_date, np.array(buy_price), sell_date, np.array(sell_price))
+            stage["Bars"], stage["Trades"] = num_bar, len(buy_date)
+
+        # generate buy and hold return
+        with self.__stage("result") as stage:
+            last_close = last_bar[1]
+            bnh = (first_close, round(last_close - first_close, 2), (last_close - first_close) / first_close)
+            stage["Bars"] = num_bar
+            return self.__finish_run(ticker, bnh, min_close, buy_and_hold)
+
+    def __start_run(self, ticker, start_date, end_date, timeframe):
+        # unique identifier of the run, which must tell apart strategies of different parameters
+        unique = self.strategy.__repr__() + "|" + ticker + "|" + str(start_date) + " to " + str(end_date) + "|" + timeframe
+        params = (self.strategy.__class__, self.strategy.params())
+        if self.__run_params.setdefault(unique, params) != params:
+            raise ValueError(f"{unique} was already backtested with other parameters, __repr__ of {self.strategy.__class__.__name__} should include its parameters")
+        if unique in self.__buyandhold:
+            print(f"{unique} was already backtested, its recorded result is kept")
+        self.__unique = unique
+
+    def __finish_run(self, ticker, bnh, min_close, buy_and_hold):
+        max_paper_loss = ((bnh[0] - min_close) / bnh[0]) if min_close < bnh[0] else 0
+        new_run = self.__unique not in self.__buyandhold
+        # append buy and hold, keeping the first result of a repeated run
+        self.__buyandhold.setdefault(self.__unique, {"UNIQUE":self.__unique,
+                                                    "Buy and Hold P/L (%)": bnh[2],
+                                                    "Buy and Hold Max Loss (%)":-max_paper_loss})
+        self.__performance = None
+        if new_run and self.__writer is not None:
+            with self.__stage("stream"):
+                transaction, closed, performance = self.__format_result(self.__ledger.to_frame(self.__unique),
+                                                                        self.__ledger.closed_frame(self.__unique),
+                                                                        self.__performance_frame([self.__unique]))
+                self.__writer.write(transaction, closed, performance)
 
         # generate result
         if buy_and_hold:
@@ -108,14 +319,28 @@ class BackTesting:
         return result
 
 
+    @staticmethod
+    def __validate(timeframe, start_date, end_date):
+        # validation
+        if timeframe not in ["1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h", "1d", "5d", "1wk", "1mo", "3mo"]:
+            raise ValueError("Only timeframe allowed are 1m,2m,5m,15m,30m,60m,90m,1h,1d,5d,1wk,1mo,3mo")
+        # validate date
+        try:
+            start_date = parser.parse(start_date)
+            end_date = parser.parse(end_date)
+        except:
+            raise ValueError("Start or End date is not a valid date format")
+        return (start_date, end_date)
+
     def __generate_result(self, ticker, buy_and_hold):
         print()
         print(f"----- {ticker} Result -----")
-        if len(self.__transaction) < 1:
+        if len(self.__ledger) < 1:
             print("No transaction based on current trading strategy.")
+            closed = pd.DataFrame(columns=["UNIQUE"])
+            pl_per = 0
         else:
-            closed = self.get_closed_position()
-            closed = closed[closed["UNIQUE"]==self.__unique].copy()
+            closed = self.__ledger.closed_frame(self.__unique)
             pl_per = closed["P/L (%)"].sum()
             pl_per = round(pl_per * 100,2)
             print(f"{self.strategy.__repr__()}: Total Profit of {pl_per}% with {len(closed)} closed position(s)")
@@ -131,97 +356,414 @@ class BackTesting:
 
 
     def __get_trading_signal(self, ticker, df, start_date, end_date, verbose):
-        # initaite trade
-        trade = 1
-        position = {}
-        signals = self.strategy.generate_signal(df)
-        df["BUY"], df["SELL"] = signals[0], signals[1]
-        df = df[(df["Date"] >= start_date) & (df["Date"] <= end_date)].copy()
-        if verbose:
-            print()
-            print(f"----- {ticker} Transaction(s) -----")
-        for row in df.iterrows():
-            row = row[1]
-            if position:
-                if pd.notnull(row["SELL"]):
-                    closed_dict = {"SellDate":row["Date"],
-                                    "SellPrice":row["SELL"]}
-                    position.update(closed_dict)
-                    # verbose
-                    if verbose:
-                        print(f"Sold {ticker} at ${round(position['SellPrice'],2)} on {str(position['SellDate'])[:10]}")
-                        
-                    
-                    # update trade
-                    trade += 1
-                    # record transaction
-                    self.__append_transaction(position)
-                    # remove position
-                    position = {}
+        with self.__stage("signal") as stage:
+            # signals are kept apart from df, which may be the cached price
+            cache = tp.IndicatorCache()
+            buy_signal, sell_signal = (np.asarray(signal) for signal in self.__generate_signal(self.strategy, df, cache))
+            self.__indicators = (self.__unique, cache)
+            stage["Bars"] = len(df)
+        with self.__stage("matching") as stage:
+            in_period = ((df["Date"] >= start_date) & (df["Date"] <= end_date)).values
+            date = pd.DatetimeIndex(df["Date"])[in_period]
+            trades = self.__close_positions(date, df["Close"].values[in_period], buy_signal[in_period], sell_signal[in_period])
+            self.__print_trades(ticker, *trades, verbose)
+            self.__record_trades(*trades[:4])
+            stage["Bars"], stage["Trades"] = len(date), len(trades[0])
+        return trades
 
-            else:
-                if pd.notnull(row["BUY"]):
-                    position = {"UNIQUE":self.__unique,
-                                "BuyPrice":row["BUY"],
-                                "BuyDate":row["Date"],
-                                "Trade":trade}
-                    # record transactions
-                    self.__append_transaction(position)
-
-                    # verbose
-                    if verbose:
-                        print(f"Bought {ticker} at ${round(position['BuyPrice'],2)} on {str(position['BuyDate'])[:10]}")
-        
-        if position:
-            final_price = df.tail(1)
-            closed_dict = {"SellDate":final_price["Date"].iloc[0],
-                            "SellPrice":final_price["Close"].iloc[0]}
-            position.update(closed_dict)
-            # update trade
-            trade += 1
-            # record transaction
-            self.__append_transaction(position)
-
-    def plot(self):
+    @staticmethod
+    def __print_trades(ticker, buy_date, buy_price, sell_date, sell_price, forced, verbose):
+        if not verbose:
+            return
+        print()
+        print(f"----- {ticker} Transaction(s) -----")
+        for i in range(len(buy_date)):
+            print(f"Bought {ticker} at ${round(buy_price[i],2)} on {str(buy_date[i])[:10]}")
+            if not forced[i]:
+                print(f"Sold {ticker} at ${round(sell_price[i],2)} on {str(sell_date[i])[:10]}")
+
+    def __record_trades(self, buy_date, buy_price, sell_date, sell_price):
+        # record transactions of the run
+        if len(buy_date) < 1:
+            return
+        run = self.__ledger.add_run(self.__unique)
+        if run is None:
+            return
+        buy_date, sell_date = pd.DatetimeIndex(buy_date), pd.DatetimeIndex(sell_date)
+        self.__ledger.record(run, buy_date.values, buy_price, sell_date.values, sell_price)
+
+        # performance metrics of the run
+        interval = self.__unique.split("|")[-1]
+        pl_per = (sell_price - buy_price) / buy_price
+        num_bar = (sell_date - buy_date).total_seconds().values // self.bar_seconds(interval)
+        self.__run_metrics[self.__unique] = self.performance_metrics(pl_per, num_bar)
+
+    @staticmethod
+    def __close_positions(date, close, buy_signal, sell_signal):
+        '''
+        Match signals into closed positions,
+        position still open at the end of the period is closed at the last price
+        Return Tuple of (buy date, buy price, sell date, sell price, forced close) arrays
+        '''
+        entry, exit = BackTesting.match_trades(buy_signal, sell_signal)
+        forced = exit < 0
+        exit_bar = np.where(forced, len(close) - 1, exit)
+        sell_price = np.where(forced, close[-1], sell_signal[exit_bar]) if len(entry) > 0 else np.array([])
+        return (date[entry], buy_signal[entry], date[exit_bar], sell_price, forced)
+
+    @staticmethod
+    def match_trades(buy_signal, sell_signal):
+        '''
+        Pair buy and sell signals into trades, only buying when there is no open position
+        and only selling after the bar the position is opened
+        Return Tuple of (entry index, exit index) arrays, exit index is -1 if position is still open at the last bar
+        '''
+        buy_bar = np.flatnonzero(pd.notnull(buy_signal))
+        sell_bar = np.flatnonzero(pd.notnull(sell_signal))
+        entry, exit = [], []
+        # jump from one signal to the next instead of walking every bar
+        next_buy = 0
+        while next_buy < len(buy_bar):
+            entry_bar = buy_bar[next_buy]
+            entry.append(entry_bar)
+            next_sell = np.searchsorted(sell_bar, entry_bar, side="right")
+            if next_sell == len(sell_bar):
+                exit.append(-1)
+                break
+            exit_bar = sell_bar[next_sell]
+            exit.append(exit_bar)
+            next_buy = np.searchsorted(buy_bar, exit_bar, side="right")
+
+        return (np.array(entry, dtype=np.int64), np.array(exit, dtype=np.int64))
+
+    def optimize(self, ticker: str, start_date: str, end_date: str, param_grid, timeframe = "1d", rank_by = "NetProfit (%)"):
+        '''
+        Backtest the class of the current strategy over a grid of parameters
+        param_grid is a dict of parameter to list of values, e.g. {"window":range(5,201), "type":["simple","weighted"]}
+        or a list of dicts of parameters for explicit combinations
+        Price is loaded once and indicators shared between combinations are computed once.
+        Nothing is recorded to transaction.
+        Return performance of every combination ranked by rank_by
+        '''
+        start_date, end_date = self.__validate(timeframe, start_date, end_date)
+        ticker = ticker.upper()
+        df = self.load_price(ticker, timeframe).sort_values("Date").dropna().reset_index(drop=True)
+        in_period = ((df["Date"] >= start_date) & (df["Date"] <= end_date)).values
+        date = pd.DatetimeIndex(df["Date"][in_period])
+        close = df["Close"].values[in_period]
+        bar = self.bar_seconds(timeframe)
+
+        cache = tp.IndicatorCache()
+        performance = []
+        for params in self.__expand_grid(param_grid):
+            strategy = self.strategy.__class__(**params)
+            buy_signal, sell_signal = self.__generate_signal(strategy, df, cache)
+            metrics = self.__signal_metrics(date, close, np.asarray(buy_signal)[in_period], np.asarray(sell_signal)[in_period], bar)
+            performance.append({**params, **metrics})
+
+        performance = pd.DataFrame(performance)
+        return performance.sort_values(rank_by, ascending=False).reset_index(drop=True)
+
+    def walk_forward(self, ticker: str, start_date: str, end_date: str, param_grid, in_sample = pd.DateOffset(years=2), out_of_sample = pd.DateOffset(months=6), timeframe = "1d", rank_by = "NetProfit (%)"):
+        '''
+        Walk-forward analysis of the class of the current strategy over a grid of parameters
+        From start_date, parameters ranked best by rank_by over an in_sample window are evaluated over the
+        out_of_sample window that follows it, then both windows roll forward by out_of_sample until end_date.
+        in_sample and out_of_sample are pd.DateOffset, param_grid is as in optimize.
+        Signals of every combination are generated once over the full price and sliced per window,
+        and positions still open at the end of a window are closed at its last price.
+        Nothing is recorded to transaction.
+        Return in-sample choice and out-of-sample performance of every window
+        '''
+        start_date, end_date = self.__validate(timeframe, start_date, end_date)
+        ticker = ticker.upper()
+        df = self.load_price(ticker, timeframe).sort_values("Date").dropna().reset_index(drop=True)
+        date = pd.DatetimeIndex(df["Date"])
+        close = df["Close"].values
+        bar = self.bar_seconds(timeframe)
+
+        # first bar of in-sample, out-of-sample and end of every window
+        windows = []
+        window_start = start_date
+        while window_start + in_sample < end_date:
+            window_end = min(window_start + in_sample + out_of_sample, end_date)
+            bounds = date.searchsorted([window_start, window_start + in_sample, window_end], side="left")
+            if window_end == end_date:
+                # end_date is inclusive as in backtesting
+                bounds[2] = date.searchsorted(end_date, side="right")
+            windows.append((window_start, window_start + in_sample, window_end, *bounds))
+            window_start = window_start + out_of_sample
+        if len(windows) < 1:
+            raise ValueError("Period from start_date to end_date is shorter than in_sample")
+
+        cache = tp.IndicatorCache()
+        param_grid = self.__expand_grid(param_grid)
+        in_sample_metrics, out_of_sample_metrics = [], []
+        for params in param_grid:
+            strategy = self.strategy.__class__(**params)
+            buy_signal, sell_signal = (np.asarray(signal) for signal in self.__generate_signal(strategy, df, cache))
+            in_sample_metrics.append([self.__signal_metrics(date[i:j], close[i:j], buy_signal[i:j], sell_signal[i:j], bar)[rank_by] for _, _, _, i, j, _ in windows])
+            out_of_sample_metrics.append([self.__signal_metrics(date[j:k], close[j:k], buy_signal[j:k], sell_signal[j:k], bar) for _, _, _, _, j, k in windows])
+        # combination by window
+        in_sample_metrics = np.array(in_sample_metrics, dtype=float).reshape(len(param_grid), len(windows))
+
+        result = []
+        for w, (window_start, out_of_sample_start, window_end, i, j, k) in enumerate(windows):
+            if i == j or j == k or np.isnan(in_sample_metrics[:, w]).all():
+                # no bar to choose parameters from or to evaluate them on
+                continue
+            best = np.nanargmax(in_sample_metrics[:, w])
+            result.append({"InSampleStart":window_start,
+                            "OutOfSampleStart":out_of_sample_start,
+                            "OutOfSampleEnd":window_end,
+                            **param_grid[best],
+                            f"InSample {rank_by}":in_sample_metrics[best, w],
+                            **out_of_sample_metrics[best][w]})
+        return pd.DataFrame(result)
+
+    @staticmethod
+    def __accepts(method, name):
+        # whether a method of the strategy takes argument name, which overrides written before it was added do not
+        parameters = inspect.signature(method).parameters
+        return name in parameters or any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values())
+
+    @staticmethod
+    def __generate_signal(strategy, df, cache):
+        # signals of strategy on df, sharing indicators through cache when generate_signal takes it
+        if BackTesting.__accepts(strategy.generate_signal, "cache"):
+            return strategy.generate_signal(df, cache)
+        return strategy.generate_signal(df)
+
+    @staticmethod
+    def __expand_grid(param_grid):
+        # list of dicts of parameters of every combination in param_grid
+        if isinstance(param_grid, dict):
+            return [dict(zip(param_grid.keys(), values)) for values in itertools.product(*param_grid.values())]
+        return list(param_grid)
+
+    @staticmethod
+    def __signal_metrics(date, close, buy_signal, sell_signal, bar):
+        # performance metrics of trading buy and sell signals over date
+        buy_date, buy_price, sell_date, sell_price, _ = BackTesting.__close_positions(date, close, buy_signal, sell_signal)
+        pl_per = (sell_price - buy_price) / buy_price
+        num_bar = (sell_date - buy_date).total_seconds().values // bar
+        return BackTesting.performance_metrics(pl_per, num_bar)
+
+    def plot(self, savefig = None, max_candles = 1000):
+        '''
+        Candlestick chart of the last backtesting with its buy and sell markers
+        savefig is an optional path to save the chart to instead of showing it, e.g. when running headless
+        Periods of more than max_candles bars are downsampled to about max_candles candles,
+        each spanning consecutive bars, while bars with a transaction are always plotted on their own.
+        Set max_candles to None to plot every bar
+        '''
+        # plotting libraries are only imported when plotting
+        import matplotlib.pyplot as plt
+        import mplfinance as mpf
         # validate
-        if len(self.__transaction) < 1:
+        if len(self.__ledger) < 1:
             raise Exception("There is no transaction yet. Run backtesting first before plotting")
         # get buying and selling price
-        df_plot = self.historical[self.__unique]
-        start_date, end_date = self.__unique.split("|")[2].split(" to ")
-        df_plot = df_plot[(df_plot["Date"] >= pd.to_datetime(start_date)) & (df_plot["Date"] <= pd.to_datetime(end_date))].set_index("Date")
-
-        signal_df = self.__transaction[self.__transaction["UNIQUE"]==self.__unique][["Date","Action","Price"]].set_index("Date")
-        buy_plot = signal_df[signal_df["Action"]=="Buy"][["Price"]].copy()
-        buy_plot = pd.merge(df_plot, buy_plot, left_index=True, right_index=True, how="left")[["Price"]]
-        sell_plot = signal_df[signal_df["Action"]=="Sell"][["Price"]].copy()
-        sell_plot = pd.merge(df_plot, sell_plot, left_index=True, right_index=True, how="left")[["Price"]]
-        
-        # add buy and sell marker
-        buy_plot = mpf.make_addplot(buy_plot,type='scatter',markersize=100,marker=6)
-        sell_plot = mpf.make_addplot(sell_plot,type='scatter',markersize=100,marker=7)
-        add_plot = [buy_plot, sell_plot]
+        _, ticker, timeperiod, timeframe = self.__unique.split("|")
+        if ticker + "|" + timeframe not in self.historical:
+            raise Exception("Price of the last backtesting is not available for plotting")
+        # same rows as the price the signals were generated on, so that its indicators can be reused
+        df_price = self.load_price(ticker, timeframe).sort_values("Date").dropna()
+        start_date, end_date = timeperiod.split(" to ")
+        df_plot = df_price[(df_price["Date"] >= pd.to_datetime(start_date)) & (df_price["Date"] <= pd.to_datetime(end_date))].set_index("Date")
+
+        transaction = self.__ledger.to_frame(self.__unique)
+        date = df_plot.index
+        position = {}
+        for action in ["Buy","Sell"]:
+            signal_df = transaction[transaction["Action"]==action]
+            bar = date.get_indexer(signal_df["Date"])
+            position[action] = (bar[bar >= 0], signal_df["Price"].values[bar >= 0])
+
+        bars = None
+        # strategies written before downsampling plot every bar
+        if max_candles and len(df_plot) > max_candles and self.__accepts(self.strategy.additional_plot_element, "bars"):
+            df_plot, bars = self.__downsample(df_plot, max_candles, np.concatenate([position["Buy"][0], position["Sell"][0]]))
+            # every transaction bar is a candle of its own, so it is the last bar of its candle
+            position = {action:(np.searchsorted(bars, bar), price) for action, (bar, price) in position.items()}
 
-        # add any additional plot for the specific tradingstrategy
-        additional_plot = self.strategy.additional_plot_element(self.historical[self.__unique], start_date, end_date)
+        # add buy and sell marker
+        add_plot = []
+        for action, marker in [("Buy", 6), ("Sell", 7)]:
+            marker_price = np.full(len(df_plot), np.nan)
+            marker_price[position[action][0]] = position[action][1]
+            add_plot.append(mpf.make_addplot(marker_price,type='scatter',markersize=100,marker=marker))
+
+        # add any additional plot for the specific tradingstrategy, reusing indicators of the run
+        unique, cache = self.__indicators
+        optional = {"cache":cache if unique == self.__unique else None, "bars":bars}
+        optional = {name:value for name, value in optional.items() if self.__accepts(self.strategy.additional_plot_element, name)}
+        additional_plot = self.strategy.additional_plot_element(df_price.copy(), start_date, end_date, **optional)
         if additional_plot:
             add_plot.extend(additional_plot)
         
-        # plot chart
-        mpf.plot(df_plot, type="candle", style ="yahoo", addplot = add_plot, title = self.__unique, figscale = 2)
-        plt.show()
+        # plot chart, which may have more than max_candles candles when there are many transactions
+        if savefig:
+            mpf.plot(df_plot, type="candle", style ="yahoo", addplot = add_plot, title = self.__unique, figscale = 2, warn_too_much_data = len(df_plot) + 1, savefig = savefig)
+        else:
+            mpf.plot(df_plot, type="candle", style ="yahoo", addplot = add_plot, title = self.__unique, figscale = 2, warn_too_much_data = len(df_plot) + 1)
+            plt.show()
+
+    @staticmethod
+    def __downsample(df, max_candles, keep):
+        '''
+        Merge consecutive bars of df, indexed by Date, into candles of about len(df) / max_candles bars,
+        taking the first open, highest high, lowest low, last close and total volume
+        Bars at positions keep are candles of their own
+        Return Tuple of (downsampled dataframe, position of the last bar of every candle)
+        '''
+        n = len(df)
+        step = -(-n // max_candles)
+        is_keep = np.zeros(n, dtype=bool)
+        is_keep[keep] = True
+        # a candle starts every step bars, at a kept bar and right after a kept bar
+        start = (np.arange(n) % step == 0) | is_keep
+        start[1:] |= is_keep[:-1]
+        first = np.flatnonzero(start)
+        last = np.append(first[1:], n) - 1
+
+        candles = {"Open":df["Open"].values[first],
+                "High":np.maximum.reduceat(df["High"].values, first),
+                "Low":np.minimum.reduceat(df["Low"].values, first),
+                "Close":df["Close"].values[last]}
+        if "Volume" in df.columns:
+            candles["Volume"] = np.add.reduceat(df["Volume"].values, first)
+        return pd.DataFrame(candles, index=df.index[first]), last
+
+    def load_price(self, ticker, timeframe):
+        # price is kept per ticker and timeframe so that it is reused across strategies and date ranges
+        key = ticker + "|" + timeframe
+        if key in self.historical:
+            price = self.historical[key]
+            if isinstance(price, CompactPrice):
+                return price.to_frame()
+            # price may have been put into historical directly
+            self.historical[key] = self.__wall_time(price)
+            return self.historical[key]
+
+        df = self.__fetch_price(ticker, timeframe)
+        if len(df) < 1:
+            raise Exception(f"No historical data found for {ticker}")
+        # save latest downloaded price
+        return self.__keep_price(ticker, timeframe, df)
+
+    def prefetch(self, tickers, timeframe = "1d", max_concurrency = 8, retries = 3, verbose = True):
+        '''
+        Load price of tickers not in historical yet, with up to max_concurrency tickers fetched at once
+        so that their network latency overlaps. Each ticker is retried up to retries times
+        Return list of tickers whose price could not be fetched
+        '''
+        tickers = [ticker.upper() for ticker in tickers]
+        missing = [ticker for ticker in tickers if ticker + "|" + timeframe not in self.historical]
+        prices = bulk_fetch(lambda ticker: self.__fetch_price(ticker, timeframe), missing, max_concurrency, retries)
+        failed = []
+        for ticker, df in prices.items():
+            if isinstance(df, Exception) or len(df) < 1:
+                failed.append(ticker)
+                if verbose:
+                    print(f"Skipped {ticker}: {df if isinstance(df, Exception) else 'No historical data found'}")
+            else:
+                self.__keep_price(ticker, timeframe, df)
+        return failed
+
+    def __fetch_price(self, ticker, timeframe):
+        # price from the persistent cache and source, without touching historical
+        if self.price_cache:
+            # only bars missing from the persistent cache are downloaded
+            df = self.price_cache.get(ticker, timeframe, date(2015,1,1), date.today(), self.source.fetch)
+        else:
+            df = self.source.fetch(ticker, timeframe, date(2015,1,1), date.today())
+        if "Adj Close" in df.columns:
+            df["Close"] = df["Adj Close"]
+            df = df.drop("Adj Close", axis=1)
+        return df
+
+    def __load_timeframes(self, ticker, timeframes):
+        # load price at the finest timeframe and resample it into the coarser ones that are not loaded yet
+        timeframes = sorted(set(timeframes), key=self.bar_seconds)
+        finest = timeframes[0]
+        for timeframe in timeframes[1:]:
+            if self.bar_seconds(timeframe) % self.bar_seconds(finest) != 0 or re.search("wk|mo", finest):
+                raise ValueError(f"{timeframe} bars cannot be built from {finest} bars")
+
+        with self.__stage("download", per_run = False) as stage:
+            df = self.load_price(ticker, finest)
+            stage["Bars"] = len(df)
+        with self.__stage("resample", per_run = False) as stage:
+            df = df.sort_values("Date").dropna()
+            for timeframe in timeframes[1:]:
+                # kept apart from downloaded bars of timeframe, which may cover a longer period
+                interval = self.__resampled(timeframe, finest)
+                if ticker + "|" + interval not in self.historical:
+                    self.__keep_price(ticker, interval, self.resample_price(df, timeframe))
+            stage["Bars"] = len(df)
+        return timeframes
 
+    @staticmethod
+    def __resampled(timeframe, finest):
+        # interval of bars of timeframe resampled from bars of finest
+        return f"{timeframe} from {finest}"
+
+    @staticmethod
+    def resample_price(df, timeframe):
+        '''
+        Build bars of timeframe from the finer bars of df, which has Date, Open, High, Low, Close and Volume
+        open is the first open, high the highest high, low the lowest low, close the last close and volume the total volume
+        '''
+        time_digit, time_str = re.search("[0-9]+",timeframe)[0], re.search("[a-z]+", timeframe)[0]
+        rule_map = {"m":"min",
+                "h":"h",
+                "d":"D",
+                "wk":"W-MON",
+                "mo":"MS"}
+        date = pd.DatetimeIndex(df["Date"])
+        offset = None
+        if time_str in ["m","h"] and len(date) > 0:
+            # intraday bars start at the session open rather than on the hour, e.g. 09:30, 10:30
+            offset = (date[0] - date[0].normalize()) % pd.Timedelta(seconds=BackTesting.bar_seconds(timeframe))
+        agg = {col:how for col, how in {"Open":"first","High":"max","Low":"min","Close":"last","Volume":"sum"}.items() if col in df.columns}
+        resampled = df.set_index(date)[list(agg)].resample(time_digit + rule_map[time_str], label="left", closed="left", offset=offset).agg(agg)
+        # drop bins without any bar, e.g. overnight and weekends
+        resampled = resampled.dropna(subset=["Close"])
+        resampled.index.name = "Date"
+        return resampled.reset_index()
 
     @staticmethod
     def download_price(ticker ,timeframe, start_date=date(2015,1,1), end_date=date.today()):
         # download historical price using yfinance
-        historical = yf.download(ticker, start=start_date, end=end_date, interval=timeframe, auto_adjust=True, progress = False)
+        historical = YahooSource().fetch(ticker, timeframe, start_date, end_date)
 
         if len(historical) <1:
             raise Exception(f"No historical data found for {ticker}")
 
-        return historical.reset_index().dropna()
-    
+        return historical
+
+    @staticmethod
+    def iter_bars(filepath, chunksize = 10000):
+        '''
+        Generator of bars from a csv file of historical price, e.g. saved from download_price
+        Return dict of Date, Open, High, Low, Close (and any other column) per bar
+        '''
+        for chunk in pd.read_csv(filepath, chunksize = chunksize):
+            chunk = chunk.rename({"Datetime":"Date"}, axis=1)
+            if "Adj Close" in chunk.columns:
+                chunk["Close"] = chunk["Adj Close"]
+                chunk = chunk.drop("Adj Close", axis=1)
+            chunk["Date"] = pd.to_datetime(chunk["Date"])
+            for bar in chunk.dropna().to_dict("records"):
+                yield bar
+
+    @staticmethod
+    def read_tickers(filepath):
+        # one ticker per line, comma or space separated tickers are also accepted
+        with open(filepath,"r") as f:
+            tickers = re.split(r"[\s,]+", f.read())
+        return [ticker.upper() for ticker in tickers if ticker]
 
     @staticmethod
     def buy_and_hold(df):
@@ -231,142 +773,187 @@ class BackTesting:
         pl_per = (cur_price - buy_price)/ buy_price
         return (buy_price, pl, pl_per)
 
-    def __append_buyandhold(self, bnh_series):
-        self.buyandhold = self.buyandhold.append(bnh_series, sort=True, ignore_index=True)
-        self.buyandhold = self.buyandhold.drop_duplicates(subset=["UNIQUE"])
-
-
-    def __append_transaction(self, position):
-        # append transaction
-        position = pd.Series(position)
-        if "SellPrice" in position.index:
-            position = position.drop([idx for idx in position.index if idx.startswith("Buy")])
-        position["Action"] = "Sell" if "SellPrice" in position.index else "Buy"
-        position = position.rename({"SellPrice":"Price",
-                                        "BuyPrice":"Price",
-                                        "BuyDate":"Date",
-                                        "SellDate":"Date"})
-        unique_list =  position["UNIQUE"].split("|")
-        uni_col = ["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL"]
-        for i in range(len(uni_col)):
-            position[uni_col[i]] = unique_list[i]
-        self.__transaction = self.__transaction.append(position, sort=True, ignore_index=True)
-        self.__transaction = self.__transaction.drop_duplicates(subset=["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL","Date","Action"])
-
-
     def get_closed_position(self):
         # validate
-        if len(self.__transaction) < 1:
+        if len(self.__ledger) < 1:
             raise Exception("There is no transaction yet. Run backtesting first")
-        self.__transaction["Date"] = pd.to_datetime(self.__transaction["Date"], format="%Y-%m-%d")
-        buy_df = self.__transaction[self.__transaction["Action"]=="Buy"].rename({"Price":"BuyPrice",
-                                                                    "Date":"BuyDate"}, axis=1).drop("Action", axis=1)
-        sell_df = self.__transaction[self.__transaction["Action"]=="Sell"].rename({"Price":"SellPrice",
-                                                                            "Date":"SellDate"}, axis=1).drop("Action", axis=1)
-
-        closed = pd.merge(buy_df, sell_df, on=["UNIQUE","TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL","Trade"])
-        closed["P/L"] = closed["SellPrice"] - closed["BuyPrice"]
-        closed["P/L (%)"] = (closed["SellPrice"] - closed["BuyPrice"]) / closed["BuyPrice"]
-        return closed
+        # closed positions are kept per run as trades are recorded
+        return self.__ledger.closed_frame().copy()
+
+    @staticmethod
+    def bar_seconds(timeframe):
+        # number of seconds in a bar of timeframe
+        time_digit, time_str = re.search("[0-9]+",timeframe)[0], re.search("[a-z]+", timeframe)[0]
+        bar_map = {"m":60,
+                "h":3600,
+                "d":86400,
+                "wk":604800,
+                "mo":2419200}
+        return int(time_digit) * bar_map[time_str]
+
+    @staticmethod
+    def performance_metrics(pl_per, num_bar):
+        '''
+        Performance metrics of one backtesting run
+        pl_per and num_bar are arrays of P/L (%) and number of bars held of each closed position
+        '''
+        pl_per, num_bar = np.asarray(pl_per, dtype=float), np.asarray(num_bar, dtype=float)
+        profit = pl_per > 0
+        # mean, max and min of empty arrays are NaN instead of raising
+        stat = lambda func, values: func(values) if len(values) > 0 else np.nan
+        return {"NetProfit (%)":pl_per.sum(),
+                "TotalTrade":len(pl_per),
+                "NumWinningTrade":profit.sum(),
+                "NumLosingTrade":(~profit).sum(),
+                "PercentProfitable":stat(np.mean, profit),
+                "LargestWining (%)":stat(np.max, pl_per),
+                "LargestLosing (%)":stat(np.min, pl_per),
+                "AverageTrade (%)":stat(np.mean, pl_per),
+                "AverageNumBar":stat(np.mean, num_bar),
+                "HighestNumBar":stat(np.max, num_bar),
+                "LowestNumBar":stat(np.min, num_bar),
+                "AvergeWinTrade":stat(np.mean, pl_per[profit]),
+                "AverageWinBar":stat(np.mean, num_bar[profit]),
+                "AvergeLossTrade":stat(np.mean, pl_per[~profit]),
+                "AverageLossBar":stat(np.mean, num_bar[~profit])}
 
     def get_performance(self):
         # validate
-        if len(self.__transaction) < 1:
+        if len(self.__ledger) < 1:
             raise Exception("There is no transaction yet. Run backtesting first")
 
-        # pre-processing
-        closed = self.get_closed_position()
-        closed["PROFIT"] = closed["P/L"].map(lambda x: True if x>0 else False)
-        closed["LOSS"] = closed["P/L"].map(lambda x: False if x>0 else True)
-
-        def get_bar(row):
-            timeframe = row["INTERVAL"]
-            time_digit, time_str = re.search("[0-9]+",timeframe)[0], re.search("[a-z]+", timeframe)[0]
-            bar_map = {"m":60,
-                    "h":3600,
-                    "d":86400,
-                    "wk":604800,
-                    "mo":2419200}
-            bar = int(time_digit) * bar_map[time_str]
-            return int((row["SellDate"] - row["BuyDate"]).total_seconds() // bar)
-    
-        closed["BAR"] = closed.apply(get_bar,axis=1)
-        # engineer performance metrics that require additional processing
-        closed_win = closed[closed["PROFIT"]][["UNIQUE","P/L (%)","BAR"]].groupby(["UNIQUE"]).agg(
-            AvergeWinTrade = pd.NamedAgg(column="P/L (%)", aggfunc="mean"),
-            AverageWinBar = pd.NamedAgg(column="BAR", aggfunc="mean")).reset_index()
-        closed_lose = closed[closed["LOSS"]][["UNIQUE","P/L (%)","BAR"]].groupby(["UNIQUE"]).agg(
-            AvergeLossTrade = pd.NamedAgg(column="P/L (%)", aggfunc="mean"),
-            AverageLossBar = pd.NamedAgg(column="BAR", aggfunc="mean")).reset_index()
-        # to handle if there is no winning or losing trade
-        if len(closed_win) == 0:
-            closed_merge = closed_lose
-        elif len(closed_lose) ==0:
-            closed_merge = closed_win
-        else:
-            closed_merge = pd.merge(closed_win, closed_lose, on="UNIQUE")
-        closed_merge = pd.merge(closed_merge, self.buyandhold, on="UNIQUE")
-
-        # get performance metrics
-        performance = closed.groupby(["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL","UNIQUE"]).agg(
-                            NetProfit = pd.NamedAgg(column="P/L (%)", aggfunc="sum"),
-                            TotalTrade = pd.NamedAgg(column="Trade", aggfunc="max"),
-                            NumWinningTrade = pd.NamedAgg(column = "PROFIT", aggfunc="sum"),
-                            NumLosingTrade = pd.NamedAgg(column="LOSS", aggfunc="sum"),
-                            PercentProfitable = pd.NamedAgg(column="PROFIT",aggfunc="mean"),
-                            LargestWining = pd.NamedAgg(column="P/L (%)", aggfunc="max"),
-                            LargestLosing = pd.NamedAgg(column="P/L (%)", aggfunc="min"),
-                            AverageTrade = pd.NamedAgg(column="P/L (%)", aggfunc="mean"),
-                            AverageNumBar = pd.NamedAgg(column="BAR", aggfunc="mean"),
-                            HighestNumBar = pd.NamedAgg(column="BAR", aggfunc="max"),
-                            LowestNumBar = pd.NamedAgg(column="BAR", aggfunc="min")).reset_index()
-
-        # rename column
-        performance = performance.rename({"NetProfit":"NetProfit (%)",
-                                        "LargestWining":"LargestWining (%)",
-                                        "LargestLosing":"LargestLosing (%)",
-                                        "AverageTrade":"AverageTrade (%)"}, axis=1)
-
-        performance = pd.merge(performance, closed_merge, on="UNIQUE").drop("UNIQUE", axis=1).set_index(["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL"])
-        performance = performance.stack().reset_index().rename({"level_4":"Performance Metrics",0:"Value"}, axis=1)
-        performance["Value"] = performance["Value"].map(lambda x: round(x, 4))
-
+        # assemble metrics cached per run, only when a run has finished since the last call
+        if self.__performance is None:
+            performance = self.__performance_frame(self.__run_metrics)
+            self.__performance = performance.sort_values(["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL"], kind="stable").reset_index(drop=True)
+
+        return self.__performance.copy()
+
+    def __performance_frame(self, uniques):
+        # long format performance metrics of runs, including their buy and hold
+        performance = []
+        for unique in uniques:
+            if unique not in self.__run_metrics:
+                continue
+            bnh = self.__buyandhold[unique]
+            metrics = {**self.__run_metrics[unique],
+                    "Buy and Hold Max Loss (%)":bnh["Buy and Hold Max Loss (%)"],
+                    "Buy and Hold P/L (%)":bnh["Buy and Hold P/L (%)"]}
+            unique_list = unique.split("|")
+            performance.extend(unique_list + [metric, value] for metric, value in metrics.items() if pd.notnull(value))
+        performance = pd.DataFrame(performance, columns=self.PERFORMANCE_COLUMNS)
+        performance["Value"] = performance["Value"].astype(float).round(4)
         return performance
 
+    @staticmethod
+    def __format_result(transaction, closed, performance):
+        # select and round columns for export, rounding whole columns at once
+        transaction = transaction[["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL","Date","Action","Price"]].copy()
+        transaction["Price"] = transaction["Price"].round(2)
 
-    def export_result(self, filepath = os.getcwd()):
-        if len(self.__transaction) < 1:
-            raise Exception("There is no result to export")
+        closed = closed[["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL","Trade","BuyDate","BuyPrice","SellDate","SellPrice","P/L","P/L (%)"]].copy()
+        closed[["BuyPrice","SellPrice","P/L"]] = closed[["BuyPrice","SellPrice","P/L"]].round(2)
+        closed["P/L (%)"] = closed["P/L (%)"].round(4)
 
-        else:
-            # get transaction
-            transaction_write = self.__transaction.copy()
-            transaction_write["Price"] = transaction_write["Price"].map(lambda x: round(x,2))
-            transaction_write["Date"] = pd.to_datetime(transaction_write["Date"], format="%Y-%m-%d")
-            transaction_write = transaction_write[["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL","Date","Action","Price"]].copy()
-
-            closed = self.get_closed_position()
-            # get closed position
-            for col in ["BuyDate","SellDate"]:
-                closed[col] = pd.to_datetime(closed[col], format="%Y-%m-%d")
-            for col in ["BuyPrice","SellPrice","P/L"]:
-                closed[col] = closed[col].map(lambda x: round(x,2))
-            closed["P/L (%)"] = closed["P/L (%)"].map(lambda x: round(x,4))
-            closed = closed[["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL","Trade","BuyDate","BuyPrice","SellDate","SellPrice","P/L","P/L (%)"]].copy()
-
-            # get performance metrics
-            performance = self.get_performance()
-            performance = performance[["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL","Performance Metrics","Value"]]
-            # write to excel
-            timestamp = str(datetime.now())[:19].replace(":","")
-            filename = os.path.join(filepath,f"backtesting result_{timestamp}.xlsx")
-            workbook = xlsxwriter.Workbook(filename)
-            workbook.close()
-            with pd.ExcelWriter(filename, date_format="YYYY-MM-DD") as writer:
-                transaction_write.to_excel(writer, sheet_name = "Transaction", index=False)
-                closed.to_excel(writer, sheet_name="Closed Position", index=False)
-                performance.to_excel(writer, sheet_name="Performance Metrics", index=False)
+        return transaction, closed, performance[BackTesting.PERFORMANCE_COLUMNS]
+
+
+    def export_result(self, filepath = os.getcwd(), format = "excel", summary_only = False):
+        '''
+        Export transaction, closed position and performance metrics of all runs to filepath
+        format is either excel (one workbook), parquet (one dataset per table) or csv (one file per table)
+        Excel is limited to 1,048,576 rows per sheet, set summary_only to write the performance metrics only
+        '''
+        if len(self.__ledger) < 1:
+            raise Exception("There is no result to export")
+        if format not in ["excel"] + ResultWriter.FORMATS:
+            raise Exception(f"Invalid format: {format}. Only excel, {', '.join(ResultWriter.FORMATS)} are supported")
+
+        with self.__stage("aggregation", per_run = False) as stage:
+            transaction, closed, performance = self.__format_result(self.__ledger.to_frame(), self.__ledger.closed_frame(), self.get_performance())
+            stage["Trades"] = len(closed)
+        with self.__stage("export", per_run = False) as stage:
+            # down to microseconds, so that exports within the same second do not write to the same files
+            timestamp = datetime.now().strftime("%Y-%m-%d %H%M%S.%f")
+            if format == "excel":
+                filename = os.path.join(filepath,f"backtesting result_{timestamp}.xlsx")
+                with pd.ExcelWriter(filename, engine="xlsxwriter", date_format="YYYY-MM-DD") as writer:
+                    if not summary_only:
+                        transaction.to_excel(writer, sheet_name = "Transaction", index=False)
+                        closed.to_excel(writer, sheet_name="Closed Position", index=False)
+                    performance.to_excel(writer, sheet_name="Performance Metrics", index=False)
+            else:
+                ResultWriter(os.path.join(filepath, f"backtesting result_{timestamp}"), format).write(transaction, closed, performance)
+            stage["Trades"] = len(closed)
 
     def clear_history(self):
-        self.__transaction = pd.DataFrame()
-        self.buyandhold = pd.DataFrame()
\ No newline at end of file
+        self.__ledger.clear()
+        self.__buyandhold = {}
+        self.__run_metrics = {}
+        self.__run_params = {}
+        self.__performance = None
+
+
+def _backtest_worker(job):
+    strategy, ticker, start_date, end_date, timeframe, cache_dir, result_store, source = job
+    bt = BackTesting(strategy, cache_dir = cache_dir, result_store = result_store, source = source)
+    try:
+        # keep the console readable when hundreds of tickers run at once
+        with contextlib.redirect_stdout(io.StringIO()):
+            bt.backtesting(ticker, start_date, end_date, timeframe = timeframe, verbose = False)
+    except Exception as e:
+        return str(e)
+    try:
+        transaction = bt.transaction
+    except Exception:
+        # no transaction based on the trading strategy
+        return None
+    closed = bt.get_closed_position().drop("UNIQUE", axis=1)
+    return (transaction, closed, bt.get_performance())
+
+
+def backtest_many(tickers, strategy: TradingStrategy, start_date: str, end_date: str, timeframe = "1d", max_workers = None, cache_dir = None, result_store = None, verbose = True, source: PriceSource = None):
+    '''
+    Backtest strategy on every ticker, fanning tickers out across a pool of processes
+    tickers is a list of tickers or the path to a .txt file of tickers
+    max_workers defaults to the number of processors, use 1 to run in the current process
+    result_store is the path to a ResultStore shared by the workers, so only tickers with new bars are recomputed
+    source is the PriceSource of every worker, e.g. LocalSource to run offline, Yahoo Finance by default
+    Return Tuple of (transaction, closed position, performance) dataframes in the order of tickers
+    On Windows, call it under if __name__ == "__main__" as worker processes re-import the calling script
+    '''
+    if isinstance(tickers, str):
+        tickers = BackTesting.read_tickers(tickers)
+    else:
+        tickers = [ticker.upper() for ticker in tickers]
+    jobs = [(strategy, ticker, start_date, end_date, timeframe, cache_dir, result_store, source) for ticker in tickers]
+
+    if max_workers == 1:
+        results = list(map(_backtest_worker, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            # map keeps results in the order of tickers regardless of completion order
+            results = list(executor.map(_backtest_worker, jobs))
+
+    transaction, closed, performance = [], [], []
+    for ticker, result in zip(tickers, results):
+        if isinstance(result, str):
+            if verbose:
+                print(f"Skipped {ticker}: {result}")
+        elif result is None:
+            if verbose:
+                print(f"No transaction for {ticker} based on current trading strategy.")
+        else:
+            transaction.append(result[0])
+            closed.append(result[1])
+            performance.append(result[2])
+    if len(transaction) < 1:
+        raise Exception("There is no transaction for any of the tickers")
+
+    merged = []
+    for frames in [transaction, closed, performance]:
+        frames = pd.concat(frames, ignore_index=True)
+        for col in ["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL"]:
+            frames[col] = frames[col].astype("category")
+        merged.append(frames)
+    return tuple(merged)
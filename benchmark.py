@@ -0,0 +1,173 @@
+'''
+Offline benchmark of the backtesting hot paths on synthetic price
+
+    python benchmark.py --bars 1000 100000 1000000 --output benchmark_result.json
+    python benchmark.py --compare benchmark_result.json --output benchmark_new.json
+
+Every stage is timed separately and the best of --repeat runs is written to json,
+so that results of two commits can be compared with --compare.
+Import time of the modules is measured in fresh interpreters, skip it with --skip import.
+'''
+import pandas as pd
+import numpy as np
+import tradingpattern as tp
+from tradingstrategy import MovingAverage, CrossOverStrategy, RelativeStrengthIndex
+from backtesting import BackTesting
+from datetime import datetime
+import contextlib
+import subprocess
+import argparse
+import tempfile
+import platform
+import json
+import time
+import sys
+import io
+import os
+
+
+def synthetic_ohlcv(bars:int, timeframe = "1m", ticker_count = 1, seed = 0, start_date = "2015-01-02"):
+    '''
+    Deterministic random walk OHLCV for ticker_count tickers named SYN0, SYN1, ...
+    Return dict of ticker to dataframe of Date, Open, High, Low, Close, Volume
+    '''
+    rng = np.random.default_rng(seed)
+    date = pd.date_range(start_date, periods=bars, freq=pd.Timedelta(seconds=BackTesting.bar_seconds(timeframe)))
+    price = {}
+    for i in range(ticker_count):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, bars)))
+        open_ = np.append(close[0], close[:-1])
+        spread = np.abs(rng.normal(0, 0.001, bars)) * close
+        price[f"SYN{i}"] = pd.DataFrame({"Date":date,
+                                        "Open":open_,
+                                        "High":np.maximum(open_, close) + spread,
+                                        "Low":np.minimum(open_, close) - spread,
+                                        "Close":close,
+                                        "Volume":rng.integers(100, 10000, bars).astype(float)})
+    return price
+
+
+def timed(func, repeat, setup = None):
+    # best wall time of repeat calls and the result of the last call, setup is called untimed before every call
+    best = np.inf
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_benchmark(bars:int, timeframe = "1m", ticker_count = 1, repeat = 3, skip = ()):
+    price = synthetic_ohlcv(bars, timeframe, ticker_count)
+    results = []
+    def record(stage, func, n = repeat, setup = None):
+        if stage in skip:
+            return None
+        seconds, result = timed(func, n, setup)
+        results.append({"stage":stage, "bars":bars, "tickers":ticker_count, "seconds":seconds})
+        return result
+
+    df = price["SYN0"]
+    for ma_type in ["simple","weighted","exponential"]:
+        record(f"moving_average[{ma_type}]", lambda: tp.moving_average(df, 20, type=ma_type))
+    for strategy in [MovingAverage(), CrossOverStrategy(), RelativeStrengthIndex()]:
+        record(f"generate_signal[{strategy.__class__.__name__}]", lambda: strategy.generate_signal(df.copy()))
+
+    bt = BackTesting(MovingAverage())
+    start_date, end_date = str(df["Date"].iloc[0]), str(df["Date"].iloc[-1])
+    for ticker, ticker_df in price.items():
+        bt.historical[ticker + "|" + timeframe] = ticker_df
+    def backtest_all():
+        bt.clear_history()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for ticker in price:
+                bt.backtesting(ticker, start_date, end_date, timeframe = timeframe, verbose = False)
+    record("backtesting", backtest_all)
+
+    # trading signal of the last backtested ticker, whose transactions are already recorded
+    signal_df = price[list(price)[-1]].copy()
+    record("__get_trading_signal", lambda: bt._BackTesting__get_trading_signal("SYN", signal_df.copy(), pd.Timestamp(start_date), pd.Timestamp(end_date), False))
+    # results are assembled once and cached until the next run, so every call is timed on fresh runs
+    record("get_closed_position", bt.get_closed_position, setup = backtest_all)
+    record("get_performance", bt.get_performance, setup = backtest_all)
+    with tempfile.TemporaryDirectory() as filepath:
+        record("export_result", lambda: bt.export_result(filepath), n = 1)
+    return results
+
+
+# libraries that should only be imported when plotting, downloading or writing excel
+OPTIONAL_DEPENDENCIES = ["matplotlib","mplfinance","yfinance","requests","xlsxwriter","pandas_ta"]
+
+
+def import_time(module, repeat = 3):
+    # best wall time of importing module in a fresh interpreter and the optional dependencies it imported
+    code = (f"import time, sys; start = time.perf_counter(); import {module}; print(time.perf_counter() - start); "
+            f"print(' '.join(m for m in {OPTIONAL_DEPENDENCIES!r} if m in sys.modules))")
+    best, loaded = np.inf, ""
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split("\n")
+        best, loaded = min(best, float(output[0])), output[1]
+    return best, loaded
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git","rev-parse","HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    before = {(r["stage"], r["bars"], r["tickers"]):r["seconds"] for r in baseline["results"]}
+    print(f"{'stage':<45}{'bars':>10}{'before (s)':>14}{'after (s)':>14}{'ratio':>8}")
+    for r in results:
+        key = (r["stage"], r["bars"], r["tickers"])
+        if key in before:
+            print(f"{r['stage']:<45}{r['bars']:>10}{before[key]:>14.4f}{r['seconds']:>14.4f}{r['seconds'] / before[key]:>8.2f}")
+
+
+def main():
+    arg = argparse.ArgumentParser(description="Benchmark backtesting on synthetic price")
+    arg.add_argument("--bars", type=int, nargs="+", default=[1000, 100000, 1000000])
+    arg.add_argument("--timeframe", default="1m")
+    arg.add_argument("--tickers", type=int, default=1)
+    arg.add_argument("--repeat", type=int, default=3)
+    arg.add_argument("--skip", nargs="*", default=[], help="stages not to run, e.g. export_result")
+    arg.add_argument("--output", default="benchmark_result.json")
+    arg.add_argument("--compare", default=None, help="json output of a previous run to compare against")
+    args = arg.parse_args()
+
+    results = []
+    for bars in args.bars:
+        results.extend(run_benchmark(bars, args.timeframe, args.tickers, args.repeat, args.skip))
+        print(f"finished {bars} bars")
+    if "import" not in args.skip:
+        for module in ["backtesting","tradingstrategy"]:
+            seconds, loaded = import_time(module, args.repeat)
+            results.append({"stage":f"import[{module}]", "bars":0, "tickers":0, "seconds":seconds})
+            print(f"import {module} loaded optional dependencies: {loaded or 'none'}")
+
+    output = {"commit":git_commit(),
+            "timestamp":str(datetime.now())[:19],
+            "python":platform.python_version(),
+            "numpy":np.__version__,
+            "pandas":pd.__version__,
+            "timeframe":args.timeframe,
+            "results":results}
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+    else:
+        for r in results:
+            print(f"{r['stage']:<45}{r['bars']:>10}{r['seconds']:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+
+
+class CompactPrice:
+    '''
+    OHLCV of one ticker and timeframe kept as int64 epoch nanoseconds and float32 columns,
+    about half the memory of a float64 dataframe.
+    With a directory, every column is a .npy file that is memory-mapped read-only,
+    so bars are paged in by the operating system only when they are read.
+    '''
+    COLUMNS = ["Open","High","Low","Close","Volume"]
+
+    def __init__(self, date, columns, tz = None):
+        self.date = date
+        self.columns = columns
+        self.tz = tz
+
+    def __len__(self):
+        return len(self.date)
+
+    @property
+    def nbytes(self):
+        return self.date.nbytes + sum(array.nbytes for array in self.columns.values())
+
+    @classmethod
+    def from_frame(cls, df, directory = None):
+        '''
+        Compact price of df, which has Date and any of Open, High, Low, Close and Volume
+        Write it to directory and memory-map it if directory is given
+        '''
+        df = df.sort_values("Date").dropna()
+        date = pd.DatetimeIndex(df["Date"])
+        tz = str(date.tz) if date.tz is not None else None
+        arrays = {"Date":date.asi8}
+        arrays.update({col:df[col].values.astype(np.float32) for col in cls.COLUMNS if col in df.columns})
+        if directory is None:
+            return cls(arrays.pop("Date"), arrays, tz)
+
+        os.makedirs(directory, exist_ok=True)
+        for col, array in arrays.items():
+            np.save(os.path.join(directory, f"{col}.npy"), array)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"tz":tz, "columns":list(arrays)}, f)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory):
+        # memory-map price written by from_frame
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            meta = json.load(f)
+        arrays = {col:np.load(os.path.join(directory, f"{col}.npy"), mmap_mode="r") for col in meta["columns"]}
+        return cls(arrays.pop("Date"), arrays, meta["tz"])
+
+    def to_frame(self):
+        # dataframe of Date and float32 columns, date is converted without copying the epoch array
+        date = pd.DatetimeIndex(np.asarray(self.date).view("datetime64[ns]"))
+        if self.tz is not None:
+            date = date.tz_localize("UTC").tz_convert(self.tz)
+        return pd.DataFrame({"Date":date, **{col:np.asarray(array) for col, array in self.columns.items()}})
@@ -0,0 +1,137 @@
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import asyncio
+import io
+import os
+
+
+def _pooled_session(pool_size):
+    # session keeping up to pool_size connections per host open for reuse
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class PriceSource:
+    '''
+    Interface of a source of historical price
+    fetch returns dataframe of Date, Open, High, Low, Close and Volume of ticker
+    from start_date (inclusive) to end_date (exclusive), which is empty if there is no price
+    '''
+
+    def fetch(self, ticker, timeframe, start_date, end_date):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class YahooSource(PriceSource):
+    '''
+    Price from Yahoo Finance, with HTTP connections pooled in one session shared by all fetches
+    yfinance and requests are only imported by the first fetch
+    '''
+
+    def __init__(self, pool_size = 16):
+        self.pool_size = pool_size
+        self.session = None
+        self.__lock = threading.Lock()
+
+    def fetch(self, ticker, timeframe, start_date, end_date):
+        import yfinance as yf
+        with self.__lock:
+            # fetches of many tickers may start at once on different threads
+            if self.session is None:
+                self.session = _pooled_session(self.pool_size)
+        historical = yf.Ticker(ticker, session = self.session).history(start=start_date, end=end_date, interval=timeframe, auto_adjust=True)
+        # intraday price is indexed by Datetime instead of Date
+        historical.index.name = "Date"
+        historical = historical.reset_index()
+        return historical[[col for col in ["Date","Open","High","Low","Close","Volume"] if col in historical.columns]].dropna()
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+
+class LocalSource(PriceSource):
+    '''
+    Stand-in source reading {ticker}_{timeframe}.parquet or .csv from a directory,
+    or .csv from an HTTP server when location is a URL, e.g. python -m http.server,
+    so that backtesting runs offline and against fixed price
+    '''
+
+    def __init__(self, location, pool_size = 16):
+        self.location = location
+        self.session = None
+        if location.startswith("http://") or location.startswith("https://"):
+            self.session = _pooled_session(pool_size)
+
+    def __read(self, ticker, timeframe):
+        name = f"{ticker}_{timeframe}"
+        if self.session is not None:
+            response = self.session.get(f"{self.location.rstrip('/')}/{name}.csv", timeout = 30)
+            if response.status_code == 404:
+                return pd.DataFrame(columns=["Date"])
+            response.raise_for_status()
+            return pd.read_csv(io.StringIO(response.text), parse_dates=["Date"])
+        path = os.path.join(self.location, name)
+        if os.path.exists(path + ".parquet"):
+            return pd.read_parquet(path + ".parquet")
+        if os.path.exists(path + ".csv"):
+            return pd.read_csv(path + ".csv", parse_dates=["Date"])
+        return pd.DataFrame(columns=["Date"])
+
+    def fetch(self, ticker, timeframe, start_date, end_date):
+        df = self.__read(ticker, timeframe)
+        date = pd.to_datetime(df["Date"])
+        start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        if date.dt.tz is not None:
+            # intraday price has dates in the time zone of the exchange
+            start_date, end_date = start_date.tz_localize(date.dt.tz), end_date.tz_localize(date.dt.tz)
+        return df[(date >= start_date) & (date < end_date)].dropna().reset_index(drop=True)
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+async def fetch_many(fetch, tickers, max_concurrency = 8, retries = 3, backoff = 1.0):
+    '''
+    Call fetch(ticker) for every ticker on a pool of threads, with at most max_concurrency calls in flight,
+    so that the network latency of tickers overlaps instead of adding up
+    A failed call is retried up to retries times, waiting backoff, 2 * backoff, ... seconds in between
+    Return dict of ticker to the result of fetch, or to the exception of its last attempt
+    '''
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_one(ticker, executor):
+        async with semaphore:
+            for attempt in range(retries + 1):
+                try:
+                    return await loop.run_in_executor(executor, fetch, ticker)
+                except Exception as e:
+                    if attempt == retries:
+                        return e
+                    await asyncio.sleep(backoff * 2 ** attempt)
+
+    with ThreadPoolExecutor(max_workers = max_concurrency) as executor:
+        results = await asyncio.gather(*(fetch_one(ticker, executor) for ticker in tickers))
+    return dict(zip(tickers, results))
+
+
+def bulk_fetch(fetch, tickers, max_concurrency = 8, retries = 3, backoff = 1.0):
+    # run fetch_many from synchronous code
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(fetch_many(fetch, tickers, max_concurrency, retries, backoff))
+    # an event loop is already running in this thread (e.g. Jupyter), so run fetch_many on a loop of its own thread
+    with ThreadPoolExecutor(max_workers = 1) as executor:
+        return executor.submit(asyncio.run, fetch_many(fetch, tickers, max_concurrency, retries, backoff)).result()
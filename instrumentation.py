@@ -0,0 +1,60 @@
+import pandas as pd
+import contextlib
+import tracemalloc
+import time
+
+
+class RunStats:
+    '''
+    Record wall time, bar count, trade count and peak memory of each stage of backtesting runs
+    hook is called with the record of every finished stage, e.g. to forward it to a metrics system
+    '''
+    COLUMNS = ["UNIQUE","Stage","Wall Time (s)","Bars","Trades","Peak Memory (MB)"]
+
+    def __init__(self, memory = True, hook = None):
+        self.memory = memory
+        self.hook = hook
+        self.__records = []
+        # highest traced memory seen by every open stage, as a nested stage resets the peak of tracemalloc
+        self.__peaks = []
+
+    @contextlib.contextmanager
+    def stage(self, unique, name):
+        '''
+        Time the enclosed block, which may set "Bars" and "Trades" of the yielded record
+        Stages may be nested, the peak memory of a stage includes that of the stages within it
+        '''
+        record = {"UNIQUE":unique, "Stage":name, "Bars":None, "Trades":None}
+        started_tracing = False
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            if self.__peaks:
+                # keep the peak of the enclosing stage so far before resetting it
+                self.__peaks[-1] = max(self.__peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+            self.__peaks.append(memory_before)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["Wall Time (s)"] = time.perf_counter() - start
+            if self.memory:
+                # peak memory allocated by the stage on top of what was allocated before it
+                peak = max(self.__peaks.pop(), tracemalloc.get_traced_memory()[1])
+                record["Peak Memory (MB)"] = (peak - memory_before) / 2**20
+                if self.__peaks:
+                    self.__peaks[-1] = max(self.__peaks[-1], peak)
+                if started_tracing:
+                    tracemalloc.stop()
+            self.__records.append(record)
+            if self.hook:
+                self.hook(record)
+
+    def to_frame(self):
+        return pd.DataFrame(self.__records, columns=self.COLUMNS).astype({"Bars":"Int64", "Trades":"Int64"})
+
+    def clear(self):
+        self.__records = []
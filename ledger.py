@@ -0,0 +1,141 @@
+import pandas as pd
+import numpy as np
+
+
+class TransactionLedger:
+    '''
+    Columnar store of buy and sell transactions across backtesting runs
+    Fills are appended to typed arrays that grow by doubling and are only
+    turned into a dataframe when read. Each run is stored once as a code
+    into the list of UNIQUE identifiers instead of repeating its strings.
+    Every trade is stored as a buy followed by its sell and the trades of
+    a run are contiguous, so closed positions are read without any merge.
+    '''
+    UNIQUE_COLUMNS = ["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL"]
+
+    def __init__(self, capacity = 1024):
+        self.__capacity = capacity
+        self.clear()
+
+    def __len__(self):
+        return self.__size
+
+    def __contains__(self, unique):
+        return unique in self.__run_code
+
+    def clear(self):
+        self.__size = 0
+        self.__columns = {"run":np.empty(self.__capacity, dtype=np.int32),
+                            "trade":np.empty(self.__capacity, dtype=np.int64),
+                            "sell":np.empty(self.__capacity, dtype=bool),
+                            "date":np.empty(self.__capacity, dtype="datetime64[ns]"),
+                            "price":np.empty(self.__capacity, dtype=np.float64)}
+        self.__runs = []
+        self.__run_code = {}
+        # first and last row of every run
+        self.__run_rows = {}
+        self.__frame = None
+        self.__closed = None
+
+    def __reserve(self, n):
+        # grow arrays by doubling so that appending is amortised O(1)
+        capacity = len(self.__columns["run"])
+        if self.__size + n <= capacity:
+            return
+        while capacity < self.__size + n:
+            capacity *= 2
+        for name, array in self.__columns.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.__size] = array[:self.__size]
+            self.__columns[name] = grown
+
+    def add_run(self, unique):
+        '''
+        Register a backtesting run and return its code
+        Return None if the run has already been recorded
+        '''
+        if unique in self.__run_code:
+            return None
+        self.__run_code[unique] = len(self.__runs)
+        self.__runs.append(unique)
+        return self.__run_code[unique]
+
+    def record(self, run, buy_date, buy_price, sell_date, sell_price):
+        '''
+        Append the trades of a run, where buy/sell date and price are arrays with one value per trade
+        '''
+        n = 2 * len(buy_date)
+        self.__reserve(n)
+        i, j = self.__size, self.__size + n
+        self.__columns["run"][i:j] = run
+        self.__columns["trade"][i:j] = np.repeat(np.arange(1, n // 2 + 1), 2)
+        self.__columns["sell"][i:j] = np.tile([False, True], n // 2)
+        self.__columns["date"][i:j] = np.column_stack([buy_date, sell_date]).ravel()
+        self.__columns["price"][i:j] = np.column_stack([buy_price, sell_price]).ravel()
+        self.__run_rows[self.__runs[run]] = (i, j)
+        self.__size = j
+        self.__frame = None
+        self.__closed = None
+
+    def __unique_columns(self, run, unique = None):
+        # categorical UNIQUE and its split columns, splitting UNIQUE once per run rather than once per transaction
+        if unique is not None:
+            # all rows are of the same run, which should not cost a split of every run
+            codes = np.zeros(len(run), dtype=np.int8)
+            values = [unique] + unique.split("|")
+            return {col:pd.Categorical.from_codes(codes, [value]) for col, value in zip(["UNIQUE"] + self.UNIQUE_COLUMNS, values)}
+        unique_split = pd.DataFrame([unique.split("|") for unique in self.__runs], columns=self.UNIQUE_COLUMNS)
+        columns = {"UNIQUE":pd.Categorical.from_codes(run, self.__runs)}
+        for col in self.UNIQUE_COLUMNS:
+            categorical = pd.Categorical(unique_split[col])
+            columns[col] = pd.Categorical.from_codes(categorical.codes[run], categorical.categories)
+        return columns
+
+    def to_frame(self, unique = None):
+        '''
+        Transactions of all runs, or of the run of unique only
+        '''
+        if unique is None:
+            if self.__frame is None:
+                self.__frame = self.__to_frame(0, self.__size)
+            return self.__frame
+        i, j = self.__run_rows.get(unique, (0, 0))
+        return self.__to_frame(i, j, unique)
+
+    def __to_frame(self, i, j, unique = None):
+        columns = {name:array[i:j].copy() for name, array in self.__columns.items()}
+        frame = {"Action":pd.Categorical.from_codes(columns["sell"].astype(np.int8), ["Buy","Sell"]),
+                "Date":columns["date"],
+                "Price":columns["price"],
+                "Trade":columns["trade"],
+                **self.__unique_columns(columns["run"], unique)}
+        return pd.DataFrame(frame)[sorted(frame.keys())]
+
+    def closed_frame(self, unique = None):
+        '''
+        Closed positions of all runs, or of the run of unique only
+        '''
+        if unique is None:
+            if self.__closed is None:
+                self.__closed = self.__closed_frame(0, self.__size)
+            return self.__closed
+        i, j = self.__run_rows.get(unique, (0, 0))
+        return self.__closed_frame(i, j, unique)
+
+    def __closed_frame(self, i, j, unique = None):
+        buy, sell = slice(i, j, 2), slice(i + 1, j, 2)
+        columns = self.__columns
+        unique_columns = self.__unique_columns(columns["run"][buy], unique)
+        closed = pd.DataFrame({"BuyDate":columns["date"][buy],
+                            "INTERVAL":unique_columns["INTERVAL"],
+                            "BuyPrice":columns["price"][buy],
+                            "TICKER":unique_columns["TICKER"],
+                            "TIMEPERIOD":unique_columns["TIMEPERIOD"],
+                            "TRADINGSTRATEGY":unique_columns["TRADINGSTRATEGY"],
+                            "Trade":columns["trade"][buy],
+                            "UNIQUE":unique_columns["UNIQUE"],
+                            "SellDate":columns["date"][sell],
+                            "SellPrice":columns["price"][sell]})
+        closed["P/L"] = closed["SellPrice"] - closed["BuyPrice"]
+        closed["P/L (%)"] = (closed["SellPrice"] - closed["BuyPrice"]) / closed["BuyPrice"]
+        return closed
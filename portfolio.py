@@ -0,0 +1,86 @@
+import pandas as pd
+import numpy as np
+from tradingstrategy import TradingStrategy
+from backtesting import BackTesting
+from datasource import PriceSource
+
+
+class Portfolio:
+    '''
+    Simulate a strategy over many tickers sharing one capital.
+    Closes and positions of every ticker are aligned into (date x ticker) arrays,
+    so sizing, cash and equity are computed for all dates and tickers at once.
+    Every open position is sized at 1 / max_positions of equity and rebalanced to it on every bar.
+    When more than max_positions positions are open, all of them are scaled down so that
+    the portfolio never holds more than its equity, i.e. cash never goes negative.
+    commission is a fraction of the value traded.
+    source is the PriceSource of the price, e.g. LocalSource to run offline, Yahoo Finance by default.
+    '''
+
+    def __init__(self, strategy: TradingStrategy, capital = 100000, max_positions = 10, commission = 0.0, cache_dir = None, source: PriceSource = None):
+        # validation
+        if not isinstance(max_positions, int) or max_positions < 1:
+            raise ValueError("max_positions must be int more than 0")
+        if capital <= 0:
+            raise ValueError("capital must be more than 0")
+        if commission < 0:
+            raise ValueError("commission cannot be negative")
+
+        # price is loaded through BackTesting, so it is shared with its historical and price cache
+        self.backtesting = BackTesting(strategy, cache_dir = cache_dir, source = source)
+        self.capital = capital
+        self.max_positions = max_positions
+        self.commission = commission
+        self.weights = None
+
+    def __positions(self, ticker, start_date, end_date, timeframe):
+        # close and whether a position is held at the end of every bar of ticker from start_date to end_date
+        df = self.backtesting.load_price(ticker, timeframe).sort_values("Date").dropna().reset_index(drop=True)
+        buy_signal, sell_signal = (np.asarray(signal) for signal in self.backtesting.strategy.generate_signal(df))
+        in_period = ((df["Date"] >= start_date) & (df["Date"] <= end_date)).values
+        close = df["Close"].values[in_period]
+        entry, exit = BackTesting.match_trades(buy_signal[in_period], sell_signal[in_period])
+        # held from the bar a position is bought until the bar it is sold, or until the last bar
+        held = np.zeros(len(close) + 1, dtype=np.int64)
+        np.add.at(held, entry, 1)
+        np.add.at(held, np.where(exit < 0, len(close) - 1, exit), -1)
+        date = pd.DatetimeIndex(df["Date"])[in_period]
+        return pd.Series(close, index=date), pd.Series(np.cumsum(held)[:-1] > 0, index=date)
+
+    def simulate(self, tickers, start_date: str, end_date: str, timeframe = "1d"):
+        '''
+        tickers is a list of tickers or the path to a .txt file of tickers
+        Return dataframe of Date, Equity, Cash, Exposure, Positions and Drawdown,
+        weights of every ticker by date are kept in weights
+        '''
+        if isinstance(tickers, str):
+            tickers = BackTesting.read_tickers(tickers)
+        else:
+            tickers = [ticker.upper() for ticker in tickers]
+        start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+
+        close, held = {}, {}
+        for ticker in tickers:
+            close[ticker], held[ticker] = self.__positions(ticker, start_date, end_date, timeframe)
+        # align on the union of dates, a ticker without a bar on a date keeps its last close and position
+        close = pd.DataFrame(close).sort_index().ffill()
+        held = pd.DataFrame(held).reindex(close.index).ffill().fillna(False).values.astype(bool)
+        if len(close) < 1:
+            raise Exception("No historical data found for any of the tickers")
+
+        # weights at the end of every bar and return of every ticker over every bar
+        positions = held.sum(axis=1)
+        weights = held / np.maximum(positions, self.max_positions)[:, None]
+        returns = np.nan_to_num(close.pct_change().values)
+        before = np.vstack([np.zeros((1, len(tickers))), weights[:-1]])
+        portfolio_return = (before * returns).sum(axis=1) - self.commission * np.abs(weights - before).sum(axis=1)
+
+        equity = self.capital * np.cumprod(1 + portfolio_return)
+        exposure = weights.sum(axis=1)
+        self.weights = pd.DataFrame(weights, index=close.index, columns=tickers)
+        return pd.DataFrame({"Date":close.index,
+                            "Equity":equity,
+                            "Cash":equity * (1 - exposure),
+                            "Exposure":exposure,
+                            "Positions":positions,
+                            "Drawdown":equity / np.maximum.accumulate(equity) - 1})
@@ -0,0 +1,75 @@
+import pandas as pd
+import os
+import json
+
+
+class PriceCache:
+    '''
+    Persistent OHLCV store with one Parquet file per ticker and timeframe.
+    The date range covered by each file is kept in a json file next to it,
+    so only the bars outside of that range are fetched on the next request.
+    '''
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def __path(self, ticker, timeframe, extension):
+        return os.path.join(self.directory, f"{ticker}_{timeframe}.{extension}")
+
+    def load(self, ticker, timeframe):
+        # return cached price and the date range it covers
+        price_path = self.__path(ticker, timeframe, "parquet")
+        coverage_path = self.__path(ticker, timeframe, "json")
+        if not os.path.exists(price_path) or not os.path.exists(coverage_path):
+            return None, None
+
+        with open(coverage_path, "r") as f:
+            coverage = json.load(f)
+        df = pd.read_parquet(price_path)
+        return df, (pd.Timestamp(coverage["start"]), pd.Timestamp(coverage["end"]))
+
+    def save(self, ticker, timeframe, df, start_date, end_date):
+        price_path = self.__path(ticker, timeframe, "parquet")
+        coverage_path = self.__path(ticker, timeframe, "json")
+        # write to temporary file first so that concurrent readers never see a partial file
+        df.to_parquet(price_path + ".tmp", index=False)
+        os.replace(price_path + ".tmp", price_path)
+        with open(coverage_path + ".tmp", "w") as f:
+            json.dump({"start":str(start_date), "end":str(end_date)}, f)
+        os.replace(coverage_path + ".tmp", coverage_path)
+
+    def get(self, ticker, timeframe, start_date, end_date, fetch):
+        '''
+        Return price of ticker from start_date (inclusive) to end_date (exclusive)
+        fetch(ticker, timeframe, start_date, end_date) is only called for the missing range
+        and may return an empty dataframe
+        '''
+        start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        df, coverage = self.load(ticker, timeframe)
+
+        if df is None:
+            df = fetch(ticker, timeframe, start_date, end_date)
+            self.save(ticker, timeframe, df, start_date, end_date)
+        else:
+            cover_start, cover_end = coverage
+            missing = []
+            if start_date < cover_start:
+                missing.append(fetch(ticker, timeframe, start_date, cover_start))
+            if end_date > cover_end:
+                # refetch from the last cached bar as it may have been incomplete when cached
+                last_bar = df["Date"].max() if len(df) > 0 else cover_end
+                if last_bar.tzinfo is not None:
+                    # coverage is kept in the wall time of the exchange, as naive dates
+                    last_bar = last_bar.tz_localize(None)
+                missing.append(fetch(ticker, timeframe, min(last_bar, cover_end), end_date))
+            if missing:
+                df = pd.concat([df] + missing, ignore_index=True)
+                df = df.drop_duplicates(subset=["Date"], keep="last").sort_values("Date").reset_index(drop=True)
+                self.save(ticker, timeframe, df, min(start_date, cover_start), max(end_date, cover_end))
+
+        tz = getattr(df["Date"].dtype, "tz", None)
+        if tz is not None:
+            # intraday price has dates in the time zone of the exchange
+            start_date, end_date = start_date.tz_localize(tz), end_date.tz_localize(tz)
+        return df[(df["Date"] >= start_date) & (df["Date"] < end_date)].reset_index(drop=True)
@@ -0,0 +1,89 @@
+import pandas as pd
+import numpy as np
+import contextlib
+import hashlib
+import sqlite3
+import json
+
+
+class ResultStore:
+    '''
+    Persistent SQLite store of the trades and buy and hold of backtesting runs.
+    A run is keyed by the parameters of its strategy, its ticker, date range and
+    timeframe, and a hash of the price it was backtested on, so a run is only
+    recomputed when the strategy or the price changed.
+    '''
+    # bump when signal or matching logic changes so that stored runs are recomputed
+    VERSION = 1
+    PRICE_COLUMNS = ["Date","Open","High","Low","Close","Volume"]
+
+    def __init__(self, path):
+        self.path = path
+        with self.__connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS runs (key TEXT PRIMARY KEY, first_close REAL, bnh_pl REAL, bnh_pl_per REAL, min_close REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS trades (key TEXT, trade INTEGER, buy_date INTEGER, buy_price REAL, sell_date INTEGER, sell_price REAL, forced INTEGER)")
+            conn.execute("CREATE INDEX IF NOT EXISTS trades_key ON trades (key)")
+
+    @contextlib.contextmanager
+    def __connect(self):
+        # commit on success and always close, as several processes may share the file
+        conn = sqlite3.connect(self.path, timeout = 60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @classmethod
+    def data_hash(cls, df):
+        # content hash of the price, independent of the index
+        columns = [col for col in cls.PRICE_COLUMNS if col in df.columns]
+        return hashlib.sha256(pd.util.hash_pandas_object(df[columns], index=False).values.tobytes()).hexdigest()
+
+    @classmethod
+    def key(cls, strategy, ticker, start_date, end_date, timeframe, df):
+        key = {"version":cls.VERSION,
+                "strategy":strategy.__class__.__name__,
+                "params":strategy.params(),
+                "ticker":ticker,
+                "start":str(start_date),
+                "end":str(end_date),
+                "timeframe":timeframe,
+                "data":cls.data_hash(df)}
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key):
+        '''
+        Return Tuple of (buy date, buy price, sell date, sell price, forced close, buy and hold, min close) of the run,
+        None if the run is not stored
+        '''
+        with self.__connect() as conn:
+            run = conn.execute("SELECT first_close, bnh_pl, bnh_pl_per, min_close FROM runs WHERE key = ?", (key,)).fetchone()
+            if run is None:
+                return None
+            trades = conn.execute("SELECT buy_date, buy_price, sell_date, sell_price, forced FROM trades WHERE key = ? ORDER BY trade", (key,)).fetchall()
+        buy_date, buy_price, sell_date, sell_price, forced = zip(*trades) if trades else ([],) * 5
+        return (pd.DatetimeIndex(np.array(buy_date, dtype="datetime64[ns]")),
+                np.array(buy_price, dtype=float),
+                pd.DatetimeIndex(np.array(sell_date, dtype="datetime64[ns]")),
+                np.array(sell_price, dtype=float),
+                np.array(forced, dtype=bool),
+                run[:3],
+                run[3])
+
+    def put(self, key, buy_date, buy_price, sell_date, sell_price, forced, bnh, min_close):
+        buy_date, sell_date = pd.DatetimeIndex(buy_date), pd.DatetimeIndex(sell_date)
+        if buy_date.tz is not None:
+            # store in exchange local time, as transactions are recorded
+            buy_date, sell_date = buy_date.tz_localize(None), sell_date.tz_localize(None)
+        trades = zip([key] * len(buy_date),
+                    range(1, len(buy_date) + 1),
+                    buy_date.asi8.tolist(),
+                    np.asarray(buy_price, dtype=float).tolist(),
+                    sell_date.asi8.tolist(),
+                    np.asarray(sell_price, dtype=float).tolist(),
+                    np.asarray(forced, dtype=int).tolist())
+        with self.__connect() as conn:
+            conn.execute("DELETE FROM trades WHERE key = ?", (key,))
+            conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?)", (key, float(bnh[0]), float(bnh[1]), float(bnh[2]), float(min_close)))
+            conn.executemany("INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?)", trades)
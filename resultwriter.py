@@ -0,0 +1,38 @@
+import pandas as pd
+import os
+
+
+class ResultWriter:
+    '''
+    Write transaction, closed position and performance metrics of backtesting runs as they finish
+    parquet: one file per write in filepath/<table>/, readable as one dataset with pd.read_parquet(filepath/<table>)
+    csv: rows appended to filepath/<table>.csv, so that no table is ever held in memory as a whole
+    '''
+    TABLES = ["transaction","closed_position","performance"]
+    FORMATS = ["parquet","csv"]
+
+    def __init__(self, filepath, format = "parquet"):
+        if format not in self.FORMATS:
+            raise Exception(f"Invalid format: {format}. Only {', '.join(self.FORMATS)} are supported")
+        self.filepath = filepath
+        self.format = format
+        # parts of different sessions writing to the same directory never overwrite each other
+        self.__session = pd.Timestamp.now().strftime("%Y-%m-%d_%H%M%S%f")
+        self.__part = 0
+        os.makedirs(filepath, exist_ok=True)
+
+    def write(self, transaction, closed, performance):
+        for table, df in zip(self.TABLES, [transaction, closed, performance]):
+            if len(df) < 1:
+                continue
+            if self.format == "parquet":
+                directory = os.path.join(self.filepath, table)
+                os.makedirs(directory, exist_ok=True)
+                name = f"part-{self.__session}-{self.__part:05d}.parquet"
+                # write to a temporary file first, which readers of the dataset skip as it starts with "_"
+                df.to_parquet(os.path.join(directory, "_" + name), index=False)
+                os.replace(os.path.join(directory, "_" + name), os.path.join(directory, name))
+            else:
+                path = os.path.join(self.filepath, f"{table}.csv")
+                df.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+        self.__part += 1
@@ -0,0 +1,71 @@
+import pandas as pd
+import numpy as np
+
+
+METRICS = ["NetProfit (%)","MaxDrawdown (%)","PercentProfitable"]
+
+
+def path_metrics(pl_per):
+    '''
+    Net profit, max drawdown and win rate of every path of a (paths x trades) matrix of P/L (%)
+    P/L (%) of trades add up as in performance metrics, drawdown is measured from the highest
+    cumulative P/L (%) reached so far, starting from 0
+    '''
+    equity = np.cumsum(pl_per, axis=1)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), 0)
+    return {"NetProfit (%)":equity[:, -1],
+            "MaxDrawdown (%)":(equity - peak).min(axis=1),
+            "PercentProfitable":(pl_per > 0).mean(axis=1)}
+
+
+def simulate(pl_per, n_sims = 10000, method = "bootstrap", chunk_size = 1000000, rng = None):
+    '''
+    Metrics of n_sims paths of trades drawn from pl_per, P/L (%) of the closed positions of a run
+    method is bootstrap (trades drawn with replacement) or shuffle (order of trades permuted)
+    Paths are drawn as (paths x trades) matrices of at most chunk_size values each to bound memory
+    Return dict of metric to array of n_sims values
+    '''
+    if method not in ["bootstrap","shuffle"]:
+        raise ValueError("method should be one of bootstrap,shuffle")
+    pl_per = np.asarray(pl_per, dtype=float)
+    if len(pl_per) < 1:
+        raise ValueError("pl_per must have at least one trade to simulate")
+    rng = rng if rng is not None else np.random.default_rng()
+    n_trades = len(pl_per)
+    rows = max(1, chunk_size // max(n_trades, 1))
+
+    metrics = {metric:np.empty(n_sims) for metric in METRICS}
+    for start in range(0, n_sims, rows):
+        n = min(rows, n_sims - start)
+        if method == "bootstrap":
+            paths = pl_per[rng.integers(0, n_trades, size=(n, n_trades))]
+        else:
+            paths = rng.permuted(np.broadcast_to(pl_per, (n, n_trades)), axis=1)
+        for metric, values in path_metrics(paths).items():
+            metrics[metric][start:start + n] = values
+    return metrics
+
+
+def robustness(closed, n_sims = 10000, method = "bootstrap", confidence = 0.95, chunk_size = 1000000, seed = None):
+    '''
+    Monte Carlo robustness of every run in closed, e.g. BackTesting.get_closed_position()
+    Return dataframe of TRADINGSTRATEGY, TICKER, TIMEPERIOD, INTERVAL, Metric, the Actual value of the run,
+    and the Mean, Lower and Upper bound of the confidence interval over the simulated paths
+    '''
+    if not 0 < confidence < 1:
+        raise ValueError("confidence must be between 0 and 1")
+    rng = np.random.default_rng(seed)
+    tail = (1 - confidence) / 2
+
+    result = []
+    # runs are told apart by their columns, as closed positions of backtest_many have no UNIQUE
+    for run_key, run in closed.groupby(["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL"], observed=True, sort=False):
+        pl_per = run.sort_values("Trade")["P/L (%)"].values
+        if len(pl_per) < 1:
+            continue
+        actual = path_metrics(pl_per[None, :])
+        simulated = simulate(pl_per, n_sims, method, chunk_size, rng)
+        for metric in METRICS:
+            lower, upper = np.quantile(simulated[metric], [tail, 1 - tail])
+            result.append(list(run_key) + [metric, actual[metric][0], simulated[metric].mean(), lower, upper])
+    return pd.DataFrame(result, columns=["TRADINGSTRATEGY","TICKER","TIMEPERIOD","INTERVAL","Metric","Actual","Mean","Lower","Upper"])
@@ -0,0 +1,67 @@
+import pandas as pd
+import numpy as np
+import contextlib
+import io
+import pytest
+from backtesting import BackTesting
+from tradingstrategy import MovingAverage, CrossOverStrategy, RelativeStrengthIndex
+from datasource import LocalSource
+
+
+def session_price(tz = None, days = 60, seed = 2):
+    # hourly bars of the regular session on weekdays, in the time zone of the exchange
+    date = pd.date_range("2021-01-04", periods=days * 24, freq="h")
+    date = date[(date.weekday < 5) & (date.hour >= 10) & (date.hour < 16)]
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.005, len(date))))
+    return pd.DataFrame({"Date":date.tz_localize(tz) if tz else date,
+                        "Open":close, "High":close * 1.002, "Low":close * 0.998, "Close":close, "Volume":1000.0})
+
+
+def backtest(source, **kwargs):
+    bt = BackTesting(MovingAverage(), source = source)
+    with contextlib.redirect_stdout(io.StringIO()):
+        bt.backtesting("SYN", "2021-01-11", "2021-02-26", verbose = False, **kwargs)
+    return bt
+
+
+def test_tz_aware_intraday_price(tmp_path):
+    (tmp_path / "aware").mkdir()
+    (tmp_path / "naive").mkdir()
+    session_price("America/New_York").to_parquet(tmp_path / "aware" / "SYN_1h.parquet", index=False)
+    session_price().to_parquet(tmp_path / "naive" / "SYN_1h.parquet", index=False)
+
+    for kwargs in [{"timeframe":"1h"}, {"timeframes":["1h","1d"]}]:
+        aware = backtest(LocalSource(str(tmp_path / "aware")), **kwargs)
+        naive = backtest(LocalSource(str(tmp_path / "naive")), **kwargs)
+        # transactions are recorded in the wall time of the exchange
+        pd.testing.assert_frame_equal(aware.transaction, naive.transaction)
+        pd.testing.assert_frame_equal(aware.get_performance(), naive.get_performance())
+        assert len(aware.transaction) > 0
+
+
+def daily_price(bars = 3000, seed = 4):
+    # daily closes rounded to cents that often do not change, so that price ties with its averages
+    rng = np.random.default_rng(seed)
+    close = np.round(50 + np.cumsum(np.where(rng.random(bars) < 0.5, 0, rng.normal(0, 0.1, bars))), 2)
+    return pd.DataFrame({"Date":pd.date_range("2010-01-01", periods=bars, freq="D"),
+                        "Open":close, "High":close + 0.01, "Low":close - 0.01, "Close":close, "Volume":1000.0})
+
+
+@pytest.mark.parametrize("strategy", [
+    MovingAverage(),
+    MovingAverage("weighted", 20, "High"),
+    MovingAverage("exponential", 15),
+    CrossOverStrategy(),
+    CrossOverStrategy({"type":"exponential", "window":5, "value":"Close"}, {"type":"weighted", "window":30, "value":"Low"}),
+    RelativeStrengthIndex(),
+    RelativeStrengthIndex((40,60))])
+def test_replay_matches_backtesting(strategy):
+    price = daily_price()
+    batch, stream = BackTesting(strategy), BackTesting(strategy)
+    batch.historical["SYN|1d"] = price
+    with contextlib.redirect_stdout(io.StringIO()):
+        batch.backtesting("SYN", "2011-01-01", "2017-12-31", verbose = False)
+        stream.replay(price.to_dict("records"), "SYN", "2011-01-01", "2017-12-31", verbose = False)
+    pd.testing.assert_frame_equal(stream.transaction, batch.transaction)
+    pd.testing.assert_frame_equal(stream.get_performance(), batch.get_performance())
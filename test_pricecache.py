@@ -0,0 +1,35 @@
+import pandas as pd
+import numpy as np
+from pricecache import PriceCache
+from datasource import LocalSource
+
+
+def hourly_price(tz = None):
+    date = pd.date_range("2021-01-04 09:30", periods=200, freq="h", tz=tz)
+    close = np.linspace(100, 120, len(date))
+    return pd.DataFrame({"Date":date, "Open":close, "High":close + 1, "Low":close - 1, "Close":close, "Volume":1000.0})
+
+
+def check_cache(tmp_path, tz):
+    price = hourly_price(tz)
+    price.to_parquet(tmp_path / "SYN_1h.parquet", index=False)
+    source = LocalSource(str(tmp_path))
+    cache = PriceCache(str(tmp_path / "cache"))
+
+    # first request fetches and caches, a longer one fetches only from the last cached bar
+    first = cache.get("SYN", "1h", "2021-01-04", "2021-01-08", source.fetch)
+    second = cache.get("SYN", "1h", "2021-01-04", "2021-01-20", source.fetch)
+
+    date = price["Date"].dt.tz_localize(None) if tz else price["Date"]
+    assert len(first) == ((date >= "2021-01-04") & (date < "2021-01-08")).sum()
+    assert len(second) == ((date >= "2021-01-04") & (date < "2021-01-20")).sum()
+    assert str(second["Date"].dt.tz) == str(tz)
+    assert second["Date"].is_unique
+
+
+def test_naive_price(tmp_path):
+    check_cache(tmp_path, None)
+
+
+def test_tz_aware_price(tmp_path):
+    check_cache(tmp_path, "America/New_York")
@@ -0,0 +1,45 @@
+import pandas as pd
+import numpy as np
+import contextlib
+import io
+from backtesting import BackTesting
+from tradingstrategy import TradingStrategy
+
+
+def daily_price(bars = 1000, seed = 1):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, bars)))
+    return pd.DataFrame({"Date":pd.date_range("2016-01-01", periods=bars, freq="D"),
+                        "Open":close, "High":close * 1.01, "Low":close * 0.99, "Close":close, "Volume":1000.0})
+
+
+class Breakout(TradingStrategy):
+    # user strategy that keeps its parameter in a public attribute and does not override params()
+
+    def __init__(self, lookback):
+        self.lookback = lookback
+
+    def generate_signal(self, df, cache=None):
+        close = df["Close"]
+        high = close.rolling(self.lookback).max().shift(1).values
+        low = close.rolling(self.lookback).min().shift(1).values
+        close = close.values
+        return (np.where(close > high, close, np.nan), np.where(close < low, close, np.nan))
+
+
+def run(strategy, result_store):
+    bt = BackTesting(strategy, result_store = result_store)
+    bt.historical["SYN|1d"] = daily_price()
+    with contextlib.redirect_stdout(io.StringIO()):
+        bt.backtesting("SYN", "2016-06-01", "2018-06-01", verbose = False)
+    return bt.transaction
+
+
+def test_parameters_share_one_store(tmp_path):
+    result_store = str(tmp_path / "result.db")
+    short, long = run(Breakout(5), result_store), run(Breakout(50), result_store)
+
+    pd.testing.assert_frame_equal(long, run(Breakout(50), None))
+    assert len(short) != len(long)
+    # stored runs are reused for the same parameters
+    pd.testing.assert_frame_equal(short, run(Breakout(5), result_store))
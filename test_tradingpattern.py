@@ -0,0 +1,35 @@
+import pandas as pd
+import numpy as np
+import pytest
+import tradingpattern as tp
+
+
+def illiquid_price(bars = 5000, seed = 3):
+    # closes rounded to cents that mostly do not change from one bar to the next, so they often tie with their average
+    rng = np.random.default_rng(seed)
+    steps = np.where(rng.random(bars) < 0.7, 0, rng.normal(0, 0.05, bars))
+    close = np.round(50 + np.cumsum(steps), 2)
+    close[[100, 2000]] = np.nan
+    return pd.DataFrame({"Close":close})
+
+
+@pytest.mark.parametrize("type", ["simple","weighted"])
+@pytest.mark.parametrize("window", [1, 2, 9, 20, 200])
+def test_moving_average_matches_rolling_apply(window, type):
+    df = illiquid_price()
+    weights = np.ones(window) if type == "simple" else np.arange(1, window + 1)
+    expected = df["Close"].rolling(window).apply(lambda x: np.dot(x, weights) / weights.sum(), raw=True).values
+
+    ma = tp.moving_average(df, window, type = type)
+    np.testing.assert_array_equal(ma, expected)
+    # price above or below its average is what strategies trade on
+    np.testing.assert_array_equal(df["Close"].values > ma, df["Close"].values > expected)
+
+
+@pytest.mark.parametrize("type", ["simple","weighted","exponential"])
+def test_moving_average_matrix_close_to_moving_average(type):
+    df = illiquid_price().ffill()
+    windows = [1, 9, 20]
+    matrix = tp.moving_average_matrix(df["Close"].values, windows, type = type)
+    for i, window in enumerate(windows):
+        np.testing.assert_allclose(matrix[:, i], tp.moving_average(df, window, type = type), rtol = 1e-9)
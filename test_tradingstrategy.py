@@ -0,0 +1,109 @@
+import pandas as pd
+import numpy as np
+import contextlib
+import io
+import pytest
+import tradingpattern as tp
+from tradingstrategy import TradingStrategy, MovingAverage, CrossOverStrategy, RelativeStrengthIndex
+from backtesting import BackTesting
+
+
+def ohlcv(bars = 500, seed = 0, cents = False):
+    # fixed random walk of daily bars, optionally rounded to cents so that prices tie with their averages
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, bars)))
+    close = np.round(close, 2) if cents else close
+    open_ = np.append(close[0], close[:-1])
+    spread = np.abs(rng.normal(0, 0.01, bars)) * close
+    return pd.DataFrame({"Date":pd.date_range("2015-01-02", periods=bars, freq="D"),
+                        "Open":open_,
+                        "High":np.maximum(open_, close) + spread,
+                        "Low":np.minimum(open_, close) - spread,
+                        "Close":close,
+                        "Volume":rng.integers(100, 10000, bars).astype(float)})
+
+
+# indicators and signals of the strategies computed row by row, as before they were vectorized
+def former_moving_average(price, window, value = "Close", type = "simple"):
+    if type == "exponential":
+        sma = price[value].rolling(window).mean()
+        ema = price[value].copy()
+        ema.iloc[0:window] = sma[0:window]
+        return ema.ewm(span = window, adjust=False).mean().values
+    weights = np.ones(window) if type == "simple" else np.arange(1, window+1)
+    return price[value].rolling(window).apply(lambda x: np.dot(x, weights) / weights.sum(), raw=True).values
+
+
+def apply_moving_average(strategy, df):
+    df["SMA"] = former_moving_average(df, strategy.window, value = strategy.value, type = strategy.type)
+    buy_signal = df.apply(lambda row: row["Close"] if row["Close"] > row["SMA"] else np.nan, axis=1).values
+    sell_signal = df.apply(lambda row: row["Close"] if row["Close"] < row["SMA"] else np.nan, axis=1).values
+    return (buy_signal, sell_signal)
+
+
+def apply_cross_over(strategy, df):
+    df["MA1"] = former_moving_average(df, strategy.ma1["window"], strategy.ma1["value"], strategy.ma1["type"])
+    df["MA2"] = former_moving_average(df, strategy.ma2["window"], strategy.ma2["value"], strategy.ma2["type"])
+    df["CROSSOVER"] = tp.cross_over(df["MA1"].values, df["MA2"].values)
+    buy_signal = df.apply(lambda row: row["MA1"] if row["CROSSOVER"]==1 else np.nan, axis=1)
+    df["CROSSUNDER"] = tp.cross_under(df["MA1"].values, df["MA2"].values)
+    sell_signal = df.apply(lambda row: row["MA1"] if row["CROSSUNDER"]==1 else np.nan, axis=1)
+    return (buy_signal.values, sell_signal.values)
+
+
+def apply_rsi(strategy, df):
+    import pandas_ta as ta
+    df["RSI"] = ta.rsi(df["Close"])
+    df["BEFORE_RSI"] = df["RSI"].shift(1)
+    buy_signal = df.apply(lambda row: row["Close"] if row["RSI"] >= strategy.buy_str and row["BEFORE_RSI"] < strategy.buy_str else np.nan, axis=1)
+    sell_signal = df.apply(lambda row: row["Close"] if row["RSI"] >= strategy.sell_str and row["BEFORE_RSI"] < strategy.sell_str else np.nan, axis=1)
+    return (buy_signal.values, sell_signal.values)
+
+
+@pytest.mark.parametrize("cents", [False, True])
+@pytest.mark.parametrize("strategy, reference", [
+    (MovingAverage(), apply_moving_average),
+    (MovingAverage(window=1), apply_moving_average),
+    (MovingAverage("weighted", 20, "High"), apply_moving_average),
+    (MovingAverage("exponential", 15), apply_moving_average),
+    (CrossOverStrategy(), apply_cross_over),
+    (CrossOverStrategy({"type":"exponential", "window":5, "value":"Close"}, {"type":"weighted", "window":30, "value":"Low"}), apply_cross_over),
+    (RelativeStrengthIndex(), apply_rsi),
+    (RelativeStrengthIndex((40,60)), apply_rsi)])
+def test_signal_matches_row_by_row(strategy, reference, cents):
+    df = ohlcv(cents = cents)
+    buy_signal, sell_signal = strategy.generate_signal(df.copy())
+    expected_buy, expected_sell = reference(strategy, df.copy())
+
+    # NaN marks the bars without a signal, so positions of NaN must match as well
+    np.testing.assert_array_equal(np.asarray(buy_signal, dtype=float), expected_buy.astype(float))
+    np.testing.assert_array_equal(np.asarray(sell_signal, dtype=float), expected_sell.astype(float))
+    assert np.isnan(expected_buy).any()
+
+
+def test_signal_leaves_price_unchanged():
+    df = ohlcv()
+    before = df.copy()
+    for strategy in [MovingAverage(), CrossOverStrategy(), RelativeStrengthIndex()]:
+        strategy.generate_signal(df)
+    pd.testing.assert_frame_equal(df, before)
+
+
+class FormerMovingAverage(TradingStrategy):
+    # user strategy written against generate_signal(self, df), adding its indicator to df
+
+    def generate_signal(self, df):
+        df["SMA"] = tp.moving_average(df, 9)
+        return (np.where(df["Close"] > df["SMA"], df["Close"], np.nan), np.where(df["Close"] < df["SMA"], df["Close"], np.nan))
+
+
+def test_strategy_with_former_signature():
+    transaction = []
+    for strategy in [FormerMovingAverage(), MovingAverage()]:
+        bt = BackTesting(strategy)
+        bt.historical["SYN|1d"] = ohlcv()
+        with contextlib.redirect_stdout(io.StringIO()):
+            bt.backtesting("SYN", "2015-03-01", "2016-03-01", verbose = False)
+        assert list(bt.historical["SYN|1d"].columns) == list(ohlcv().columns)
+        transaction.append(bt.transaction.drop("TRADINGSTRATEGY", axis=1))
+    pd.testing.assert_frame_equal(*transaction)
@@ -12,30 +12,236 @@ def moving_average(price: pd.DataFrame, window:int, value="Close", type="simple"
         raise Exception("Type should be one of simple,weighted,exponential")
 
     if type == "exponential":
-        sma = price[value].rolling(window).mean()
-        ema = price[value].copy()
+        sma = price[value].astype(float).rolling(window).mean()
+        ema = price[value].astype(float)
         ema.iloc[0:window] = sma[0:window]
         ma = ema.ewm(span = window, adjust=False).mean().values
     else:
-        if type == "simple":
-            weights = np.ones(window)
-        elif type =="weighted":
-            weights = np.arange(1, window+1)
-        ma = price[value].rolling(window).apply(lambda x: np.dot(x, weights) / weights.sum(), raw=True).values
+        ma = _window_average(price[value].values, window, type)
 
     return ma
 
 
+def _window_average(price, window, type="simple"):
+    '''
+    Simple or weighted average of every window of price, NaN until the window is filled
+    Every window is averaged on its own with a dot product, so averages are exactly
+    those of rolling(window).apply and signals comparing price with them do not flip at ties
+    '''
+    weights = np.arange(1, window + 1, dtype=float) if type == "weighted" else np.ones(window)
+    price = np.asarray(price, dtype=float)
+    ma = np.full(len(price), np.nan)
+    if 0 < window <= len(price):
+        windows = np.lib.stride_tricks.sliding_window_view(price, window)
+        ma[window - 1:] = np.fromiter((np.dot(x, weights) for x in windows), dtype=float, count=len(windows)) / weights.sum()
+    return ma
+
+
+def moving_average_matrix(price, windows, type="simple"):
+    '''
+    Moving average of a price array for many windows at once, e.g. to sweep windows
+    Sums are taken from cumulative sums, so averages may differ from moving_average in the last digits
+    Return (bars x windows) float matrix, NaN until the window is filled
+    simple and weighted averages are NaN for any window containing NaN price,
+    exponential average expects price without NaN
+    '''
+    # validation
+    if type not in ["simple","weighted","exponential"]:
+        raise Exception("Type should be one of simple,weighted,exponential")
+    for window in windows:
+        if not isinstance(window, (int, np.integer)) or window < 1:
+            raise Exception("Window must be integer more than 0")
+
+    price = np.asarray(price, dtype=float)
+    ma = np.full((len(price), len(windows)), np.nan)
+    for i, window in enumerate(windows):
+        if type == "exponential":
+            ma[:, i] = _exponential_average(price, window)
+        else:
+            weight_sum = window * (window + 1) / 2 if type == "weighted" else window
+            ma[:, i] = _rolling_sum(price, window, weighted = type == "weighted") / weight_sum
+    return ma
+
+
+def _rolling_sum(price, window, weighted=False, block=1024):
+    '''
+    Sum of every window of price, with weights 1..window from oldest to latest if weighted
+    Cumulative sums are taken over blocks of bars, offset by the first price of the block,
+    so that their rounding error does not grow with the length of price
+    '''
+    n = len(price)
+    total = np.full(n, np.nan)
+    if n < window:
+        return total
+
+    is_nan = np.isnan(price)
+    price = np.where(is_nan, 0, price)
+    # every block holds the window - 1 bars before it, and blocks are padded up to the same length
+    block = max(block, 4 * window)
+    num_window = n - window + 1
+    num_block = -(-num_window // block)
+    padded = np.append(price, np.zeros(num_block * block + window - 1 - n))
+    segment = np.lib.stride_tricks.sliding_window_view(padded, block + window - 1)[::block]
+    anchor = segment[:, :1]
+    cumsum = np.zeros((num_block, block + window))
+    cumsum[:, 1:] = np.cumsum(segment - anchor, axis=1)
+
+    if weighted:
+        # sum of k * price over a window equals window * cumsum minus the sum of the window previous cumsums
+        cumsum2 = np.zeros((num_block, block + window))
+        cumsum2[:, 1:] = np.cumsum(cumsum[:, :-1], axis=1)
+        sums = window * cumsum[:, window:] - (cumsum2[:, window:] - cumsum2[:, :block])
+        sums = sums + anchor * window * (window + 1) / 2
+    else:
+        sums = cumsum[:, window:] - cumsum[:, :block] + anchor * window
+    total[window - 1:] = sums.ravel()[:num_window]
+
+    # window with any NaN price has no average
+    nan_count = np.append(0, np.cumsum(is_nan))
+    total[window - 1:][(nan_count[window:] - nan_count[:-window]) > 0] = np.nan
+    return total
+
+
+def _exponential_average(price, window):
+    '''
+    Exponential average seeded with the simple average of the first window,
+    y[t] = (1 - alpha) * y[t-1] + alpha * price[t] solved in closed form over blocks of bars
+    '''
+    n = len(price)
+    ema = np.full(n, np.nan)
+    if n < window:
+        return ema
+
+    alpha = 2 / (window + 1)
+    decay = 1 - alpha
+    ema[window - 1] = price[:window].mean()
+    if decay == 0:
+        ema[window:] = price[window:]
+        return ema
+
+    # longest block before decay ** -block overflows
+    block = max(1, int(600 / -np.log(decay)))
+    start = window
+    while start < n:
+        x = price[start:start + block]
+        power = decay ** np.arange(len(x))
+        # y[k] = decay^(k+1) * y[-1] + alpha * decay^k * sum_j(decay^-j * x[j])
+        ema[start:start + len(x)] = decay * power * ema[start - 1] + alpha * power * np.cumsum(x / power)
+        start += len(x)
+    return ema
+
+
 def cross_over(ma1, ma2):
+    '''
+    1 where ma1 crosses over ma2 and 0 otherwise, along the first axis
+    so that matrices of moving average pairs (bars x pairs) are compared at once
+    '''
     crossover = np.where(ma1 > ma2, 1,0)
-    crossover = np.diff(crossover)
-    crossover = np.append(np.array([0]) , crossover)
+    crossover = np.diff(crossover, axis=0, prepend=crossover[:1])
     crossover = np.where(crossover == 1, 1,0)
     return crossover
 
 def cross_under(ma1, ma2):
     crossunder = np.where(ma1 > ma2, 1,0)
-    crossunder = np.diff(crossunder)
-    crossunder = np.append(np.array([0]) , crossunder)
+    crossunder = np.diff(crossunder, axis=0, prepend=crossunder[:1])
     crossunder = np.where(crossunder == -1, 1,0)
-    return crossunder
\ No newline at end of file
+    return crossunder
+
+
+class IndicatorCache:
+    '''
+    Memoise indicators computed over one price dataframe, so that strategies
+    sharing an indicator (e.g. the same moving average window) compute it once.
+    A cache must only be used with the price it was filled from.
+    '''
+    def __init__(self):
+        self.__indicators = {}
+
+    def get(self, key, compute):
+        if key not in self.__indicators:
+            self.__indicators[key] = compute()
+        return self.__indicators[key]
+
+    def moving_average(self, price: pd.DataFrame, window:int, value="Close", type="simple"):
+        return self.get(("moving_average", window, value, type), lambda: moving_average(price, window, value, type))
+
+
+class MovingAverageState:
+    '''
+    Moving average updated one price at a time, giving exactly the values of moving_average over the same prices
+    simple and weighted averages take the same dot product of the last window prices, in time of window rather than history,
+    exponential average is seeded and smoothed with the same arithmetic as pandas rolling mean and ewm
+    '''
+    def __init__(self, window:int, type="simple"):
+        # validation
+        if not isinstance(window, int) or window < 1:
+            raise Exception("Window must be integer more than 0")
+        if type not in ["simple","weighted","exponential"]:
+            raise Exception("Type should be one of simple,weighted,exponential")
+
+        self.window = window
+        self.type = type
+        self.__weights = np.arange(1, window + 1, dtype=float) if type == "weighted" else np.ones(window)
+        # last prices kept twice in a row, so that the last window prices are a contiguous slice
+        self.__buffer = np.zeros(2 * window)
+        self.__count = 0
+        self.__ema = np.nan
+
+    def update(self, price):
+        window, i = self.window, self.__count % self.window
+        self.__buffer[i] = price
+        self.__buffer[i + window] = price
+        self.__count += 1
+        if self.__count < window:
+            return np.nan
+
+        if self.type == "exponential":
+            if self.__count == window:
+                self.__ema = pd.Series(self.__buffer[:window]).rolling(window).mean().iloc[-1]
+            elif self.__ema != price:
+                alpha = 1 / (1 + (window - 1) / 2)
+                self.__ema = ((1 - alpha) * self.__ema + alpha * price) / ((1 - alpha) + alpha)
+            return self.__ema
+
+        # last window prices from the oldest to the latest
+        return np.dot(self.__buffer[i + 1:i + 1 + window], self.__weights) / self.__weights.sum()
+
+
+class RsiState:
+    '''
+    Relative strength index updated one price at a time in constant time,
+    with the same Wilder smoothing and arithmetic as pandas_ta rsi
+    '''
+    def __init__(self, length=14):
+        self.length = length
+        self.__previous = np.nan
+        self.__count = 0
+        # exponentially weighted averages of gains and losses, and the weight of their past values
+        self.__gain = np.nan
+        self.__loss = np.nan
+        self.__weight = 1.0
+
+    def update(self, price):
+        change = price - self.__previous
+        self.__previous = price
+        if np.isnan(change):
+            return np.nan
+
+        gain, loss = max(change, 0.0), min(change, 0.0)
+        self.__count += 1
+        if self.__count == 1:
+            self.__gain, self.__loss = gain, loss
+        else:
+            # as pandas ewm(alpha = 1 / length) with adjust
+            self.__weight *= 1 - 1 / self.length
+            if self.__gain != gain:
+                self.__gain = (self.__weight * self.__gain + gain) / (self.__weight + 1)
+            if self.__loss != loss:
+                self.__loss = (self.__weight * self.__loss + loss) / (self.__weight + 1)
+            self.__weight += 1
+        if self.__count < self.length:
+            return np.nan
+
+        if self.__gain + abs(self.__loss) == 0:
+            return np.nan
+        return 100 * self.__gain / (self.__gain + abs(self.__loss))
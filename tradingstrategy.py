@@ -1,30 +1,61 @@
 import pandas as pd
 import numpy as np
-import mplfinance as mpf
 import tradingpattern as tp
-import pandas_ta as ta
 
 class TradingStrategy:
 
     def __init__(self):
         pass
 
-    def generate_signal(self, df):
+    def generate_signal(self, df, cache=None):
         buy_signal = df["Close"].values
         sell_signal = df["Close"].values
         return (buy_signal, sell_signal)
 
+    def on_bar(self, bar):
+        '''
+        Update strategy with the next bar, a mapping of Date, Open, High, Low and Close
+        Return Tuple of (buy price, sell price) of the bar, NaN when there is no signal
+        '''
+        return (bar["Close"], bar["Close"])
+
+    def reset(self):
+        # clear state of on_bar before streaming another series of bars
+        pass
 
     def __repr__(self):
         return f"{self.__class__.__name__}"
 
-    def additional_plot_element(self, df, start_date, end_date):
+    def params(self):
+        '''
+        Parameters that determine the signals of the strategy, used to identify stored backtesting results
+        Default to the public attributes of the strategy, override it when parameters are kept elsewhere
+        '''
+        return {name:value for name, value in sorted(vars(self).items()) if not name.startswith("_")}
+
+    def additional_plot_element(self, df, start_date, end_date, cache=None, bars=None):
+        '''
+        List of mplfinance addplots drawn over the price of df from start_date to end_date
+        cache is the tp.IndicatorCache filled by generate_signal on df, so that indicators are not recomputed
+        bars are the positions within the period of the bars plotted when the chart is downsampled
+        '''
         return None
 
+    @staticmethod
+    def plot_values(df, values, start_date, end_date, bars=None):
+        # values of the rows of df from start_date to end_date, only at bars when downsampled
+        in_period = ((df["Date"] >= start_date) & (df["Date"] <= end_date)).values
+        values = np.asarray(values)[in_period]
+        return values if bars is None else values[bars]
+
     def __name__(self):
         return "TradingStrategy"
 
 
+def _ma_label(type, window, value):
+    # window of a moving average, followed by its type and value when they are not the default simple of Close
+    return " ".join([str(window)] + [type] * (type != "simple") + [value] * (value != "Close"))
+
 
 class MovingAverage(TradingStrategy):
     
@@ -41,6 +72,7 @@ class MovingAverage(TradingStrategy):
         self.__window = window
         self.__value = value
         self.type = type
+        self.__stream = None
 
     @property
     def window(self):
@@ -63,27 +95,46 @@ class MovingAverage(TradingStrategy):
             raise ValueError("Moving averager price should be Open, High, Low, or Close")
         self.__value = new_value
 
-    def generate_signal(self, df):
+    def generate_signal(self, df, cache=None):
         '''
         Identify buy and sell signals and the respective price
         Return Tuple of (bool, float)
         baseline strategy -> Buy when above SMA, Sell when below SMA
+        cache is an optional tp.IndicatorCache of df shared with other strategies,
+        indicators are kept in cache rather than added to df
         '''
-        df["SMA"] = tp.moving_average(df, self.window, value = self.value, type = self.type)
-        buy_signal = df.apply(lambda row: row["Close"] if row["Close"] > row["SMA"] else np.nan, axis=1).values
-        sell_signal = df.apply(lambda row: row["Close"] if row["Close"] < row["SMA"] else np.nan, axis=1).values
+        cache = cache if cache is not None else tp.IndicatorCache()
+        sma = cache.moving_average(df, self.window, value = self.value, type = self.type)
+        close = df["Close"].values
+        buy_signal = np.where(close > sma, close, np.nan)
+        sell_signal = np.where(close < sma, close, np.nan)
         return (buy_signal, sell_signal)
 
-    def additional_plot_element(self, df, start_date, end_date):
-        df["ADDPLOT"] = tp.moving_average(df, self.window, value = self.value, type = self.type)
-        df = df[(df["Date"] >= start_date) & (df["Date"] <= end_date)].copy()
-        addplot = df["ADDPLOT"]
+    def on_bar(self, bar):
+        if self.__stream is None:
+            self.reset()
+        close = bar["Close"]
+        sma = self.__stream.update(bar[self.value])
+        buy_signal = close if close > sma else np.nan
+        sell_signal = close if close < sma else np.nan
+        return (buy_signal, sell_signal)
+
+    def reset(self):
+        self.__stream = tp.MovingAverageState(self.window, self.type)
+
+    def additional_plot_element(self, df, start_date, end_date, cache=None, bars=None):
+        import mplfinance as mpf
+        cache = cache if cache is not None else tp.IndicatorCache()
+        addplot = self.plot_values(df, cache.moving_average(df, self.window, value = self.value, type = self.type), start_date, end_date, bars)
 
         return [mpf.make_addplot(addplot, type="line", width=1)]
 
 
     def __repr__(self):
-        return f"{self.__class__.__name__}({self.window})"
+        return f"{self.__class__.__name__}({_ma_label(self.type, self.window, self.value)})"
+
+    def params(self):
+        return {"type":self.type, "window":self.window, "value":self.value}
     
 
 class CrossOverStrategy(TradingStrategy):
@@ -95,31 +146,54 @@ class CrossOverStrategy(TradingStrategy):
 
         self.ma1 = ma1
         self.ma2 = ma2
+        self.__stream = None
 
-    def generate_signal(self, df):
+    def generate_signal(self, df, cache=None):
         '''
         Buy when ma1 crossover ma2,
         Sell when ma1 crossunder ma2
         '''
-        df["MA1"] = tp.moving_average(df, self.ma1["window"], self.ma1["value"], self.ma1["type"])
-        df["MA2"] = tp.moving_average(df, self.ma2["window"], self.ma2["value"], self.ma2["type"])
-        df["CROSSOVER"] = tp.cross_over(df["MA1"].values, df["MA2"].values)
-        buy_signal = df.apply(lambda row: row["MA1"] if row["CROSSOVER"]==1 else np.nan, axis=1)
-        df["CROSSUNDER"] = tp.cross_under(df["MA1"].values, df["MA2"].values)
-        sell_signal = df.apply(lambda row: row["MA1"] if row["CROSSUNDER"]==1 else np.nan, axis=1)
+        cache = cache if cache is not None else tp.IndicatorCache()
+        ma1 = cache.moving_average(df, self.ma1["window"], self.ma1["value"], self.ma1["type"])
+        ma2 = cache.moving_average(df, self.ma2["window"], self.ma2["value"], self.ma2["type"])
+        buy_signal = np.where(tp.cross_over(ma1, ma2) == 1, ma1, np.nan)
+        sell_signal = np.where(tp.cross_under(ma1, ma2) == 1, ma1, np.nan)
+
+        return (buy_signal, sell_signal)
 
+    def on_bar(self, bar):
+        if self.__stream is None:
+            self.reset()
+        ma1_state, ma2_state, before_above = self.__stream
+        ma1 = ma1_state.update(bar[self.ma1["value"]])
+        ma2 = ma2_state.update(bar[self.ma2["value"]])
+        above = ma1 > ma2
+        self.__stream = (ma1_state, ma2_state, above)
+        if before_above is None:
+            return (np.nan, np.nan)
+        buy_signal = ma1 if above and not before_above else np.nan
+        sell_signal = ma1 if before_above and not above else np.nan
         return (buy_signal, sell_signal)
 
-    def additional_plot_element(self, df, start_date, end_date):
-        df["MA1"] = tp.moving_average(df, self.ma1["window"], self.ma1["value"], self.ma1["type"])
-        df["MA2"] = tp.moving_average(df, self.ma2["window"], self.ma2["value"], self.ma2["type"])
-        df = df[(df["Date"] >= start_date) & (df["Date"] <= end_date)].copy()
-        addplot1 , addplot2 = df["MA1"], df["MA2"]
-        
+    def reset(self):
+        # moving average states and whether ma1 was above ma2 on the previous bar
+        self.__stream = (tp.MovingAverageState(self.ma1["window"], self.ma1["type"]),
+                        tp.MovingAverageState(self.ma2["window"], self.ma2["type"]),
+                        None)
+
+    def additional_plot_element(self, df, start_date, end_date, cache=None, bars=None):
+        import mplfinance as mpf
+        cache = cache if cache is not None else tp.IndicatorCache()
+        addplot1 = self.plot_values(df, cache.moving_average(df, self.ma1["window"], self.ma1["value"], self.ma1["type"]), start_date, end_date, bars)
+        addplot2 = self.plot_values(df, cache.moving_average(df, self.ma2["window"], self.ma2["value"], self.ma2["type"]), start_date, end_date, bars)
+
         return [mpf.make_addplot(addplot1, type="line", width=1), mpf.make_addplot(addplot2, type="line", width=1)]
 
-    def __repr(self):
-        return f"{self.__class__.__name__})"
+    def __repr__(self):
+        return f"{self.__class__.__name__}({_ma_label(**self.ma1)},{_ma_label(**self.ma2)})"
+
+    def params(self):
+        return {"ma1":dict(self.ma1), "ma2":dict(self.ma2)}
 
 
 
@@ -135,28 +209,58 @@ class RelativeStrengthIndex(TradingStrategy):
 
         self.buy_str = buy_str
         self.sell_str = sell_str
+        self.__stream = None
     
 
-    def generate_signal(self, df):
-        df["RSI"] = df.ta.rsi()
-        df["BEFORE_RSI"] = df["RSI"].shift(1)
-        buy_signal = df.apply(lambda row: row["Close"] if row["RSI"] >= self.buy_str and row["BEFORE_RSI"] < self.buy_str else np.nan, axis=1)
-        sell_signal = df.apply(lambda row: row["Close"] if row["RSI"] >= self.sell_str and row["BEFORE_RSI"] < self.sell_str else np.nan, axis=1)
+    def generate_signal(self, df, cache=None):
+        # pandas_ta is only imported by strategies that use it
+        import pandas_ta as ta
+        cache = cache if cache is not None else tp.IndicatorCache()
+        rsi = cache.get(("rsi",), lambda: ta.rsi(df["Close"].astype(float)).values)
+        before_rsi = np.append(np.nan, rsi[:-1])
+        close = df["Close"].values
+        buy_signal = np.where((rsi >= self.buy_str) & (before_rsi < self.buy_str), close, np.nan)
+        sell_signal = np.where((rsi >= self.sell_str) & (before_rsi < self.sell_str), close, np.nan)
 
         return (buy_signal, sell_signal)
 
+    def on_bar(self, bar):
+        if self.__stream is None:
+            self.reset()
+        rsi_state, before_rsi = self.__stream
+        close = bar["Close"]
+        rsi = rsi_state.update(close)
+        self.__stream = (rsi_state, rsi)
+        buy_signal = close if rsi >= self.buy_str and before_rsi < self.buy_str else np.nan
+        sell_signal = close if rsi >= self.sell_str and before_rsi < self.sell_str else np.nan
+        return (buy_signal, sell_signal)
+
+    def reset(self):
+        # rsi state and rsi of the previous bar
+        self.__stream = (tp.RsiState(), np.nan)
+
+    def __repr__(self):
+        if (self.buy_str, self.sell_str) == (30, 70):
+            return f"{self.__class__.__name__}"
+        return f"{self.__class__.__name__}({self.buy_str},{self.sell_str})"
+
+    def params(self):
+        return {"strength":[self.buy_str, self.sell_str]}
+
     
-    def additional_plot_element(self, df, start_date, end_date):
-        df["RSI"] = df.ta.rsi()
-        df = df[(df["Date"] >= start_date) & (df["Date"] <= end_date)].copy()
+    def additional_plot_element(self, df, start_date, end_date, cache=None, bars=None):
+        import mplfinance as mpf
+        import pandas_ta as ta
+        cache = cache if cache is not None else tp.IndicatorCache()
+        rsi = self.plot_values(df, cache.get(("rsi",), lambda: ta.rsi(df["Close"].astype(float)).values), start_date, end_date, bars)
 
         rsi_ylim = (0, 100)
 
         addplots = [
-            mpf.make_addplot(df["RSI"], ylabel="RSI", width=1.5, color="black",panel=1, ylim=rsi_ylim),
-            mpf.make_addplot(np.array([self.buy_str] * len(df)), color="green", width=1, panel=1, ylim=rsi_ylim),
-            mpf.make_addplot(np.array([50] * len(df)), color="gray", width=0.8, panel=1, ylim=rsi_ylim),
-            mpf.make_addplot(np.array([self.sell_str] * len(df)), color="red", width=1, panel=1, ylim=rsi_ylim)]
+            mpf.make_addplot(rsi, ylabel="RSI", width=1.5, color="black",panel=1, ylim=rsi_ylim),
+            mpf.make_addplot(np.array([self.buy_str] * len(rsi)), color="green", width=1, panel=1, ylim=rsi_ylim),
+            mpf.make_addplot(np.array([50] * len(rsi)), color="gray", width=0.8, panel=1, ylim=rsi_ylim),
+            mpf.make_addplot(np.array([self.sell_str] * len(rsi)), color="red", width=1, panel=1, ylim=rsi_ylim)]
 
         return addplots
     
\ No newline at end of file